@@ -0,0 +1,79 @@
+from .plotting.histers import make_gen_acceptance_hist, make_gen_efficiency_hist, make_gen_multiplicity_hist
+from .taggers.columns import declare_columns
+from .taggers.gen_filter import matched_reco_quality
+from .taggers.gen_acceptance import NO_MASS_POINT, gen_leptons, mass_points
+
+
+def gen_acceptance_dict(events, ele_id="ele"): # gen only: reads GenPart and GenModel, no reco collection
+
+    """
+    Signal acceptance per mass point from the generator record alone, for acceptance scans over a signal grid.
+    Events without a GenModel mass point flag are skipped.
+    """
+
+    masses = mass_points(events.GenModel)
+    is_signal = masses.m_parent != NO_MASS_POINT
+
+    masses = masses[is_signal]
+    leptons = gen_leptons(events[is_signal].GenPart, masses, ele_id)
+
+    ##############
+    # fill hists #
+    #############
+
+    gen_lep_hist = make_gen_acceptance_hist(
+        leptons,
+        [0,2,3,4,5,7,10,20,45,75,1000],
+        [0,0.8,1.4442,1.556,2.5,3],
+       )
+
+    gen_multiplicity_hist = make_gen_multiplicity_hist(leptons, masses)
+
+    ################
+    # fill results #
+    ###############
+
+    results = {
+        "gen_lep_hist": gen_lep_hist,
+        "gen_multiplicity_hist": gen_multiplicity_hist,
+    }
+
+    return results
+
+
+def gen_efficiency_dict(events, *tagged, ele_id="ele"): # tagged: the tagged reco collections, e.g. tag_ele(events.Electron)
+
+    """
+    Efficiency denominators on the gen side: every prompt gen lepton, matched or not, by the best quality of
+    the reco objects matched to it (reco_qual_tag, NO_RECO_MATCH if none). The reco efficiency at a quality is
+    h[{"reco_qual_tag": q}] over the sum of all categories, in gen pt and |eta|.
+    """
+
+    genpart = events.GenPart
+    genpart["reco_qual_tag"] = matched_reco_quality(genpart, *tagged) # on all of GenPart, so genPartIdx lines up
+
+    leptons = gen_leptons(genpart, ele_id=ele_id)
+
+    ##############
+    # fill hists #
+    #############
+
+    gen_eff_hist = make_gen_efficiency_hist(
+        leptons,
+        [0,2,3,4,5,7,10,20,45,75,1000],
+        [0,0.8,1.4442,1.556,2.5,3],
+       )
+
+    ################
+    # fill results #
+    ###############
+
+    results = {
+        "gen_eff_hist": gen_eff_hist,
+    }
+
+    return results
+
+
+declare_columns(gen_acceptance_dict, gen_leptons)
+declare_columns(gen_efficiency_dict, gen_leptons)
@@ -57,11 +57,14 @@ def tag_and_combine_ele(electron, lowptelectron):
 
 
 
-def lep_analysis_dict(obj):
+def lep_analysis_dict(obj, weight=None):
     
     """
     structure will be a dict with lots of hists of various configurations
+    weight: e.g. events.genWeight * xsec * lumi / sumw for MC, broadcast to the objects (Weight storage hists)
     """
+
+    obj = FlatColumns(obj) # pt, |eta|, gen_tag, ... flattened once and shared by all the hists below
     
     ##############
     # fill hists #
@@ -70,56 +73,6 @@ def lep_analysis_dict(obj):
     gens = [-10, 10, 11, 12, 13] #I added 1 in front for gens so I know I don't accidentally get it mixed up with qual
     quals = [-1,1,2,3]
     
-    pt_eta_hist = make_2d2d_hist_cat(
-        obj,                           
-        [2,3,4,5,7,10,20,45,75,1000], 
-        [0,0.8,1.4442,1.556,2.5],
-        cat1_binning = gens,
-        cat2_binning = quals,
-        var1_name = 'pt',
-        var2_name = 'eta',
-        cat1_name='gen_tag',
-        cat2_name='qual_tag',
-        var2_abs=True
-       )
-    
-    pt_eta_hist_muon_v1 = make_2d2d_hist_cat(
-        obj,                           
-        [2,3,4,5,7,10,20,45,75,1000], 
-        [0,0.8,1.556,2.5],
-        cat1_binning = gens,
-        cat2_binning = quals,
-        var1_name = 'pt',
-        var2_name = 'eta',
-        cat1_name='gen_tag',
-        cat2_name='qual_tag',
-        var2_abs=True
-       )
-
-    pt_eta_hist_muon_v2 = make_2d2d_hist_cat(
-        obj,                           
-        [2,3,4,5,7,10,20,45,75,1000], 
-        [0,0.9,1.2,2.1,2.4],
-        cat1_binning = gens,
-        cat2_binning = quals,
-        var1_name = 'pt',
-        var2_name = 'eta',
-        cat1_name='gen_tag',
-        cat2_name='qual_tag',
-        var2_abs=True
-       )
-
-    pt_AN_v1 = make_1d2d_hist_reg_cat(
-    obj,
-    [40,0,100], #like [100, 0, 100] 100 bins between 0 and 100
-    cat1_binning = gens,
-    cat2_binning = quals,
-    var_name="pt",
-    cat1_name="gen_tag",
-    cat2_name="qual_tag",
-    var_abs=False,
-    )
-
     pt_bins_v2 = [2,3,4,5,7,10,12.5,15.0,17.5,20.0,
                22.5,25.0,27.5,30.0,32.5,35.0,
                37.5,40.0,42.5,45.0,47.5,50.0,
@@ -127,17 +80,6 @@ def lep_analysis_dict(obj):
                67.5,70.0,72.5,75.0,77.5,80.0,
                82.5,85.0,87.5,90.0,92.5,95.0,
                97.5,100.0]
-    
-    pt_AN_v2 = make_1d2d_hist_var_cat(
-    obj,
-    pt_bins_v2, 
-    cat1_binning = gens,
-    cat2_binning = quals,
-    var_name="pt",
-    cat1_name="gen_tag",
-    cat2_name="qual_tag",
-    var_abs=False,
-    )
 
     pt_bins_v3 = [2,5,7.5,10,12.5,15.0,17.5,20.0,
                22.5,25.0,27.5,30.0,32.5,35.0,
@@ -146,17 +88,6 @@ def lep_analysis_dict(obj):
                67.5,70.0,72.5,75.0,77.5,80.0,
                82.5,85.0,87.5,90.0,92.5,95.0,
                97.5,100.0]
-    
-    pt_AN_v3 = make_1d2d_hist_var_cat(
-    obj,
-    pt_bins_v3, 
-    cat1_binning = gens,
-    cat2_binning = quals,
-    var_name="pt",
-    cat1_name="gen_tag",
-    cat2_name="qual_tag",
-    var_abs=False,
-    )
 
     pt_bins_muon = [3,5,7.5,10,12.5,15.0,17.5,20.0,
                22.5,25.0,27.5,30.0,32.5,35.0,
@@ -165,17 +96,6 @@ def lep_analysis_dict(obj):
                67.5,70.0,72.5,75.0,77.5,80.0,
                82.5,85.0,87.5,90.0,92.5,95.0,
                97.5,100.0]
-    
-    pt_AN_muon = make_1d2d_hist_var_cat(
-    obj,
-    pt_bins_muon, 
-    cat1_binning = gens,
-    cat2_binning = quals,
-    var_name="pt",
-    cat1_name="gen_tag",
-    cat2_name="qual_tag",
-    var_abs=False,
-    )
 
     pt_bins_v4 = [1,2,3,4,5,6,7,8,9,10,
                   12.5,15.0,17.5,20.0,
@@ -185,45 +105,46 @@ def lep_analysis_dict(obj):
                67.5,70.0,72.5,75.0,77.5,80.0,
                82.5,85.0,87.5,90.0,92.5,95.0,
                97.5,100.0]
-    
-    pt_AN_v4 = make_1d2d_hist_var_cat(
-    obj,
-    pt_bins_v4, 
-    cat1_binning = gens,
-    cat2_binning = quals,
-    var_name="pt",
-    cat1_name="gen_tag",
-    cat2_name="qual_tag",
-    var_abs=False,
-    )
 
-    
-
-# (obj, var_binning, cat_binning, var_name = "pt", cat_name="genPartFlav")
-
-    ################
-    # fill results #
-    ###############
-
-    results = {
-        "pt_eta_hist": pt_eta_hist,
-        "pt_eta_hist_muon_v1": pt_eta_hist_muon_v1,
-        "pt_eta_hist_muon_v2": pt_eta_hist_muon_v2,
-        "pt_AN_hist_v1": pt_AN_v1,
-        "pt_AN_hist_v2": pt_AN_v2,
-        "pt_AN_hist_v3": pt_AN_v3,
-        "pt_AN_hist_muon": pt_AN_muon,
-        "pt_AN_hist_v4": pt_AN_v4,
-    }
+    # the three pt x |eta| hists only differ in |eta| binning and the five pt_AN hists in pt binning:
+    # each family is filled once on the union of its edges, the hists are sums of those bins.
+    # Both are filled in the same pass, sharing the pt, gen_tag and qual_tag bin lookups
+
+    results = make_hists(obj, {
+        "pt_eta": [
+            var_axis("pt", [2,3,4,5,7,10,20,45,75,1000]),
+            {
+                "pt_eta_hist":         var_axis("eta", [0,0.8,1.4442,1.556,2.5], absolute=True),
+                "pt_eta_hist_muon_v1": var_axis("eta", [0,0.8,1.556,2.5], absolute=True),
+                "pt_eta_hist_muon_v2": var_axis("eta", [0,0.9,1.2,2.1,2.4], absolute=True),
+            },
+            cat_axis("gen_tag", gens),
+            cat_axis("qual_tag", quals),
+        ],
+        "pt_AN": [
+            {
+                "pt_AN_hist_v1":   reg_axis("pt", 40, 0, 100), # 40 bins between 0 and 100
+                "pt_AN_hist_v2":   var_axis("pt", pt_bins_v2),
+                "pt_AN_hist_v3":   var_axis("pt", pt_bins_v3),
+                "pt_AN_hist_muon": var_axis("pt", pt_bins_muon),
+                "pt_AN_hist_v4":   var_axis("pt", pt_bins_v4),
+            },
+            cat_axis("gen_tag", gens),
+            cat_axis("qual_tag", quals),
+        ],
+    }, weight=weight)
 
     return results
 
 
-def lpte_analysis_dict(obj): # has lpte specific variables, do not run on a collection without these variables
+def lpte_analysis_dict(obj, weight=None): # has lpte specific variables, do not run on a collection without these variables
     
     """
     structure will be a dict with lots of hists of various configurations
+    weight: like lep_analysis_dict
     """
+
+    obj = FlatColumns(obj) # pt, |eta|, gen_tag, ... flattened once and shared by all the hists below
     
     ##############
     # fill hists #
@@ -232,54 +153,51 @@ def lpte_analysis_dict(obj): # has lpte specific variables, do not run on a coll
     gens = [-10, 10, 11, 12, 13] #I added 1 in front for gens so I know I don't accidentally get it mixed up with qual
     quals = [-1,1,2,3]
     
-    pt_eta_hist = make_2d2d_hist_cat(
-        obj,                           
-        [1,2,3,4,5,7,10,20,45,75,1000], 
-        [0,0.8,1.4442,1.556,2.5],
-        cat1_binning = gens,
-        cat2_binning = quals,
-        var1_name = 'pt',
-        var2_name = 'eta',
-        cat1_name='gen_tag',
-        cat2_name='qual_tag',
-        var2_abs=True
-       )
+    # one pass for the three hists, |eta|, ID, gen_tag and qual_tag are binned once for all of them
+
+    results = make_hists(obj, {
+        "pt_eta_hist": [
+            var_axis("pt", [1,2,3,4,5,7,10,20,45,75,1000]),
+            var_axis("eta", [0,0.8,1.4442,1.556,2.5], absolute=True),
+            cat_axis("gen_tag", gens),
+            cat_axis("qual_tag", quals),
+        ],
+        "pt_ID_hist": [
+            reg_axis("pt", 20, 0, 20),
+            reg_axis("ID", 100, 0, 10, absolute=True),
+            cat_axis("gen_tag", gens),
+            cat_axis("qual_tag", quals),
+        ],
+        "ID_eta_hist": [
+            var_axis("eta", [0,0.8,1.4442,1.556,2.5], absolute=True),
+            reg_axis("ID", 100, 0, 10),
+            cat_axis("gen_tag", gens),
+            cat_axis("qual_tag", quals),
+        ],
+    }, weight=weight)
+
+    return results
 
-    pt_ID_hist = make_2d2d_hist_cat_2reg(
-        obj,                           
-        [20,0,20], 
-        [100,0,10],
-        cat1_binning = gens,
-        cat2_binning = quals,
-        var1_name = 'pt',
-        var2_name = 'ID',
-        cat1_name='gen_tag',
-        cat2_name='qual_tag',
-        var2_abs=True
-       )  
-
-    ID_eta_hist = make_2d2d_hist_cat_1reg(
-        obj,              
+
+
+def ele_vid_analysis_dict(obj): # needs vidNestedWPBitmap, so Electron only
+
+    """
+    N-1 and cumulative cutflow of every cutBasedID cut at every level, filled in one pass
+    """
+
+    vid_cutflow = make_vid_cutflow_hist(
+        obj,
+        [2,3,4,5,7,10,20,45,75,1000],
         [0,0.8,1.4442,1.556,2.5],
-        [100,0,10], 
-        cat1_binning = gens,
-        cat2_binning = quals,
-        var1_name = 'eta',
-        var2_name = 'ID',
-        cat1_name='gen_tag',
-        cat2_name='qual_tag',
-        var1_abs=True
-       )  
+       )
 
     ################
     # fill results #
     ###############
 
     results = {
-        "pt_eta_hist": pt_eta_hist,
-        "pt_ID_hist": pt_ID_hist,
-        "ID_eta_hist": ID_eta_hist,
+        "vid_cutflow_hist": vid_cutflow,
     }
 
     return results
-
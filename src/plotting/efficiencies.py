@@ -8,6 +8,8 @@ import awkward as ak
 
 import hist.dask as dah
 
+from ..taggers.vid_unpacked import PASS_CUT, PASS_OTHERS, PASS_PREVIOUS
+
 
 
 def init_plt():
@@ -60,6 +62,42 @@ def two_d_eff_err(h_num, h_denom): # h_num and h_denom must have same binning in
 
 
 
+#### VID CUTFLOW EFFs HERE ###
+
+def vid_n_minus_1_eff_err(h_cutflow, level): # h_cutflow from make_vid_cutflow_hist (computed)
+
+    """
+    N-1 efficiency of every cutBasedID cut at one level (1 veto ... 4 tight),
+    i.e. passing the cut out of passing all other cuts. Arrays are shaped (pt, eta, cut)
+    """
+
+    values = h_cutflow.values()[:, :, :, level - 1, :]
+    patterns = np.arange(values.shape[-1])
+
+    both = PASS_CUT | PASS_OTHERS
+    num = values[..., (patterns & both) == both].sum(axis=-1)
+    denom = values[..., (patterns & PASS_OTHERS) != 0].sum(axis=-1)
+
+    eff = num/denom
+    err = np.sqrt(eff * (1 - eff)/ denom)
+
+    return np.nan_to_num(eff, nan=0), np.nan_to_num(err, nan=0)
+
+
+def vid_cumulative_counts(h_cutflow, level):
+
+    """
+    Number of electrons passing every cut up to and including each cut (VID_CUTS order), shaped (pt, eta, cut)
+    """
+
+    values = h_cutflow.values()[:, :, :, level - 1, :]
+    patterns = np.arange(values.shape[-1])
+
+    both = PASS_CUT | PASS_PREVIOUS
+    return values[..., (patterns & both) == both].sum(axis=-1)
+
+
+
 ### Plotting Effs ####
 
 
@@ -1,9 +1,21 @@
 #file for defining generic yet precise histogramming functions
 
+import sys
+from functools import partial
+from operator import getitem
+
 import numpy as np
 import awkward as ak
 
 import hist.dask as dah
+from dask import delayed
+from hist import Hist, axis as hist_axis, storage as hist_storage
+
+from ..taggers.flat_kernels import broadcast_flat, is_dask
+from ..taggers.vid_unpacked import VID_CUTS, vid_cutflow_patterns
+from ..taggers.quality import QUAL_TAGS
+from ..taggers.gen_filter import NO_RECO_MATCH
+from ..taggers.spec_tagger import compile_spec, scan_quality_from_spec
 
 """
 Histograms are written to be multi-dimensional, i.e. they will have many axis that you must then later "project out" the axis you are interested in. For example, a pt hist (1 axis is pt) and then 4 GenFlav axis. It is a "5D" hist, but we project out only "pt and genflav=1" to see the pt distribution of genflav1 whatever.
@@ -12,70 +24,375 @@ this is useful because do you want to call a function 3 times to fill the exact
 """
 
 
+#######################
+## Generic Histogram ##
+#######################
+
+"""
+Every builder below is make_hist with a list of axis specs: reg_axis, var_axis, cat_axis or bool_axis of a field of obj
+(optionally its absolute value). make_hist reads and flattens each field once per call, however many axes use it (once per FlatColumns when given one).
+"""
+
+
+class FlatColumns:
+
+    """
+    The flattened fields of one collection, each computed once: columns("eta", absolute=True) is |eta| flattened.
+    Give it to the builders instead of the collection to share the flattening between all their histograms,
+    e.g. for the duration of one analysis dict. columns.obj is the collection itself.
+    """
+
+    def __init__(self, obj):
+        self.obj = obj
+        self._flat = {} # (field, absolute) -> flat column
+
+    def __call__(self, field, absolute=False):
+        if (field, absolute) not in self._flat:
+            self._flat[(field, absolute)] = np.abs(self(field)) if absolute else ak.flatten(getattr(self.obj, field))
+        return self._flat[(field, absolute)]
+
+    def weight(self, weight):
+        """
+        Flat per-object weights from a field name, a jagged array like the fields, or per-event weights
+        (e.g. genWeight * xsec * lumi / sum of genWeight), which are repeated over each event's objects
+        """
+        if isinstance(weight, str):
+            return self(weight)
+        if weight.ndim == 1:
+            return broadcast_flat(weight, ak.num(self.obj, axis=1))
+        return ak.flatten(weight)
+
+
+def reg_axis(name, bins, start, stop, absolute=False, label=None):
+    """Regular axis on the field 'name', like Reg(bins, start, stop)"""
+    return {"name": name, "kind": "regular", "binning": (bins, start, stop), "absolute": absolute, "label": label or name}
+
+
+def var_axis(name, edges, absolute=False, label=None):
+    """Variable axis on the field 'name' with the given bin edges"""
+    return {"name": name, "kind": "variable", "binning": list(edges), "absolute": absolute, "label": label or name}
+
+
+def cat_axis(name, categories, label=None, growth=False):
+    """Integer category axis on the field 'name'"""
+    return {"name": name, "kind": "intcat", "binning": list(categories), "absolute": False, "label": label or "", "growth": growth}
+
+
+def bool_axis(name, label=None):
+    """Boolean axis on the field 'name'"""
+    return {"name": name, "kind": "boolean", "binning": None, "absolute": False, "label": label or ""}
+
+
+def make_hist(obj, axes, weight=None):
+
+    """
+    Histogram with one axis per spec in axes (reg_axis / var_axis / cat_axis / bool_axis), filled with the flattened fields of obj
+    (a collection, or the FlatColumns of one to reuse columns flattened by other histograms).
+    weight: a field name, a jagged array like the fields or one weight per event (FlatColumns.weight), the storage
+    is then Weight: every bin keeps the sum of weights and the sum of squared weights (h.variances()).
+    """
+
+    hist = dah.Hist(*(_axis(spec) for spec in axes), storage=hist_storage.Double() if weight is None else hist_storage.Weight())
+
+    columns = obj if isinstance(obj, FlatColumns) else FlatColumns(obj)
+
+    flat_vars = {spec["name"]: columns(spec["name"], spec["absolute"]) for spec in axes}
+    if weight is not None:
+        flat_vars["weight"] = columns.weight(weight)
+
+    hist.fill(**flat_vars)
+
+    return hist
+
+
+def make_hist_family(obj, axes, weight=None):
+
+    """
+    Histograms that differ only in the binning of one numeric axis, from a single fill. One entry of axes is a
+    {view name: reg_axis or var_axis spec} dict of binnings of the same field instead of a spec: the fill is done once
+    on the union of all their edges and every view is made by summing those fine bins (flows included).
+    Returns {view name: histogram}, each a dask delayed hist.Hist computed along with the rest of the results.
+    """
+
+    position = _family_position(axes)
+    fine_spec, views = _family_axis(axes[position])
+
+    fine = make_hist(obj, axes[:position] + [fine_spec] + axes[position + 1:], weight)
+
+    return {view: delayed(_rebin_view, pure=True)(fine, position, axis) for view, axis in views.items()}
+
+
+def make_hists(obj, hists, weight=None):
+
+    """
+    Several histograms of the same collection in one fused pass: hists is {name: axes} like make_hist (an axes list
+    may hold one binning family, like make_hist_family, whose views then replace name in the output).
+    Every distinct axis (field, abs, binning) gets its bin index computed once, shared by all histograms using it,
+    and each histogram is one bincount over its combined index. Returns {name: histogram}: hist.Hist on eager
+    collections, hist.dask histograms on dask ones (computed along with the rest of the results, from the same reads).
+    Growing category axes are not supported here, use make_hist for those.
+    """
+
+    plan, families = {}, {} # name -> specs that get filled / (family position, {view: axis})
+    for name, axes in hists.items():
+        position = _family_position(axes)
+        if position is not None:
+            fine_spec, views = _family_axis(axes[position])
+            axes = axes[:position] + [fine_spec] + axes[position + 1:]
+            families[name] = (position, views)
+        if any(spec.get("growth") for spec in axes):
+            sys.exit(f'{name}: growing axes cannot be filled by make_hists, use make_hist')
+        plan[name] = axes
+
+    columns = obj if isinstance(obj, FlatColumns) else FlatColumns(obj)
+
+    keys = sorted({(spec["name"], spec["absolute"]) for axes in plan.values() for spec in axes})
+    flat = [columns(*key) for key in keys]
+    if weight is not None:
+        flat.append(columns.weight(weight))
+
+    if any(is_dask(column) for column in flat):
+        import dask_awkward as dak
+        from dask.base import tokenize
+
+        # one collection for all columns, filled partition by partition in its graph: the hist.dask histograms share the
+        # dask-awkward optimization (and IO layer) of everything computed with them, so every partition is read and tagged once
+        table = dak.zip({str(i): column for i, column in enumerate(flat)})
+        return _dask_hists(table, plan, families, keys, weight is not None, token=tokenize(table, hists, weight is not None))
+
+    return _fused_hists(plan, families, keys, weight is not None, *flat)
+
+
+def _dask_hists(table, plan, families, keys, weighted, token):
+    # {name: hist.dask histogram} from the _fused_hists of every partition of the zipped flat columns, added up in one tree reduction
+    import dask
+    from dask.highlevelgraph import HighLevelGraph, MaterializedLayer
+    from dask.local import identity
+    from dask_awkward.lib.core import partitionwise_layer
+    from dask_histogram.core import AggHistogram
+    from dask_histogram.layers import MockableDataFrameTreeReduction
+
+    name, summed = f"make-hists-{token}", f"make-hists-sum-{token}"
+    layers = {
+        **table.dask.layers,
+        name: partitionwise_layer(partial(_table_hists, plan, families, keys, weighted), name, table),
+        summed: MockableDataFrameTreeReduction(
+            name=summed,
+            name_input=name,
+            npartitions_input=table.npartitions,
+            concat_func=_sum_hists,
+            tree_node_func=identity,
+            finalize_func=identity,
+            split_every=dask.config.get("histogram.aggregation.split-every", 8),
+            tree_node_name=f"make-hists-combine-{token}",
+        ),
+    }
+    dependencies = {**table.dask.dependencies, name: {table.name}, summed: {name}}
+
+    empty = _fused_hists(plan, families, keys, weighted, *([np.zeros(0)] * len(table.fields)))
+
+    results = {}
+    for hist_name, histref in empty.items():
+        picked = f"make-hists-{hist_name}-{token}"
+        graph = HighLevelGraph(
+            {**layers, picked: MaterializedLayer({(picked, 0): (getitem, (summed, 0), hist_name)})},
+            {**dependencies, picked: {summed}},
+        )
+        results[hist_name] = AggHistogram(graph, picked, histref=histref)
+
+    return results
+
+
+def _table_hists(plan, families, keys, weighted, table):
+    # _fused_hists of one partition of the zipped flat columns (length zero, all columns touched, while dask-awkward traces the graph)
+    table = ak.typetracer.length_zero_if_typetracer(table)
+    return _fused_hists(plan, families, keys, weighted, *(table[field] for field in table.fields))
+
+
+def _fused_hists(plan, families, keys, weighted, *flat):
+    # {name: hist.Hist} of one chunk, the views of a family replacing its name
+
+    counts = _fused_counts(plan, keys, *flat)
+
+    results = {}
+    for name, axes in plan.items():
+        hist = _counts_hist(counts, name, axes, weighted)
+        if name in families:
+            position, views = families[name]
+            results.update({view: _rebin_view(hist, position, axis) for view, axis in views.items()})
+        else:
+            results[name] = hist
+
+    return results
+
+
+def _sum_hists(partitions):
+    # add up the _fused_hists of several partitions
+    return {name: sum(hists[name] for hists in partitions) for name in partitions[0]}
+
+
+def _fused_counts(plan, keys, *flat):
+    # {name: flat bin contents with flows (weighted: stacked sum of weights and sum of squares)} of one chunk
+
+    flat = [ak.to_numpy(column) for column in flat]
+    columns, weight = dict(zip(keys, flat)), (flat[len(keys)] if len(flat) > len(keys) else None)
+
+    index = {} # axis definition -> flow bin index of every entry, once per distinct axis
+    counts = {}
+    for name, axes in plan.items():
+        for spec in axes:
+            if _axis_key(spec) not in index:
+                index[_axis_key(spec)] = _bin_index(spec, columns[(spec["name"], spec["absolute"])])
+
+        extents = [_axis(spec).extent for spec in axes]
+        linear = np.ravel_multi_index([index[_axis_key(spec)] for spec in axes], extents)
+        size = int(np.prod(extents))
+
+        if weight is None:
+            counts[name] = np.bincount(linear, minlength=size).astype(np.float64)
+        else:
+            counts[name] = np.stack([
+                np.bincount(linear, weights=weight, minlength=size),
+                np.bincount(linear, weights=np.square(weight, dtype=np.float64), minlength=size),
+            ])
+
+    return counts
+
+
+def _counts_hist(counts, name, axes, weighted):
+    # the hist.Hist of one histogram of _fused_counts
+
+    hist = Hist(*(_axis(spec) for spec in axes), storage=hist_storage.Weight() if weighted else hist_storage.Double())
+
+    values = hist.view(flow=True)
+    if weighted:
+        values["value"] = counts[name][0].reshape(values.shape)
+        values["variance"] = counts[name][1].reshape(values.shape)
+    else:
+        values[...] = counts[name].reshape(values.shape)
+
+    return hist
+
+
+def _axis_key(spec):
+    # what makes two axis specs bin their entries the same way
+    binning = spec["binning"] if spec["binning"] is None else tuple(spec["binning"])
+    return (spec["name"], spec["absolute"], spec["kind"], binning)
+
+
+def _bin_index(spec, values):
+    # index of every value along the axis, flow bins included, the way boost-histogram bins it
+
+    if spec["kind"] == "regular":
+        bins, start, stop = spec["binning"]
+        z = (values.astype(np.float64) - start) / (stop - start)
+        index = np.full(len(values), bins + 1, dtype=np.int64) # overflow, NaN included
+        index[z < 0] = 0
+        inside = (z >= 0) & (z < 1)
+        index[inside] = (z[inside] * bins).astype(np.int64) + 1
+        return index
+
+    if spec["kind"] == "variable":
+        return np.searchsorted(np.asarray(spec["binning"], dtype=np.float64), values.astype(np.float64), side="right")
+
+    if spec["kind"] == "intcat":
+        categories = np.asarray(spec["binning"], dtype=np.int64)
+        order = np.argsort(categories)
+        position = np.searchsorted(categories[order], values).clip(max=len(categories) - 1)
+        found = categories[order][position] == values
+        return np.where(found, order[position], len(categories)) # unknown values go to the overflow bin
+
+    if spec["kind"] == "boolean":
+        return values.astype(np.int64)
+
+    sys.exit(f'invalid axis kind: {spec["kind"]}')
+
+
+def _family_position(axes):
+    # index of the binning family ({view: spec} dict) in axes, None if there is none
+    return next((i for i, spec in enumerate(axes) if "kind" not in spec), None)
+
+
+def _family_axis(views):
+    # the spec binned on the union of the family's edges, and the hist axis of every view
+
+    family = {(spec["name"], spec["absolute"], spec["label"]) for spec in views.values()}
+    if len(family) != 1 or any(spec["kind"] not in ("regular", "variable") for spec in views.values()):
+        sys.exit(f'a binning family must be regular/variable binnings of one field, got {list(views.values())}')
+    (name, absolute, label), = family
+
+    union = np.unique(np.concatenate([_axis(spec).edges for spec in views.values()]))
+
+    return var_axis(name, union, absolute, label), {view: _axis(spec) for view, spec in views.items()}
+
+
+def _rebin_view(fine, position, axis):
+    # the fine histogram with its axis at position replaced by axis (same field, edges a subset of the fine ones)
+
+    fine_edges = fine.axes[position].edges
+    lower = np.concatenate([[-np.inf], fine_edges[:-1], [fine_edges[-1]]]) # lower edge of every fine bin, flows included
+    target = np.searchsorted(axis.edges, lower, side="right") # 0 is the view's underflow, len(edges) its overflow
+
+    merge = np.zeros((len(lower), len(axis.edges) + 1))
+    merge[np.arange(len(lower)), target] = 1
+
+    view = fine.__class__(*(axis if i == position else fine_axis for i, fine_axis in enumerate(fine.axes)), storage=fine.storage_type())
+
+    fine_values, values = fine.view(flow=True), view.view(flow=True)
+    for field in fine_values.dtype.names or [None]: # value and variance of a Weight storage
+        summed = np.moveaxis(np.tensordot(fine_values if field is None else fine_values[field], merge, axes=([position], [0])), -1, position)
+        if field is None:
+            values[...] = summed
+        else:
+            values[field] = summed
+
+    return view
+
+
+def _axis(spec):
+    # the hist axis of a spec
+
+    if spec["kind"] == "regular":
+        bins, start, stop = spec["binning"]
+        return hist_axis.Regular(bins, start, stop, name=spec["name"], label=spec["label"])
+    if spec["kind"] == "variable":
+        return hist_axis.Variable(spec["binning"], name=spec["name"], label=spec["label"])
+    if spec["kind"] == "intcat":
+        return hist_axis.IntCategory(spec["binning"], name=spec["name"], label=spec["label"], growth=spec["growth"])
+    if spec["kind"] == "boolean":
+        return hist_axis.Boolean(name=spec["name"], label=spec["label"])
+
+    sys.exit(f'invalid axis kind: {spec["kind"]}')
+
+
 ###################
 ## 1D Histograms ##
 ###################
 
 
 def make_1d_pt_hist(obj): #I intend to have the user rebin this later
-        
-    hist = (
-        dah.Hist.new
-        .Regular(500, 0, 500, name="pt") #500 (1 GeV) bins between 0 and 500
-        .Double()
-        .fill(
-            pt=ak.flatten(obj.pt),
-            )
-        )
-    
-    return hist
+
+    return make_hist(obj, [reg_axis("pt", 500, 0, 500)]) #500 (1 GeV) bins between 0 and 500
     
 
 def make_1d_pt_hist_var(obj, pt_bins):
  
     #pt_bins = [2,3,4,5,7,8,10,15,20,30,45,60,75,500]
 
-    hist = (
-        dah.Hist.new
-        .Variable(pt_bins, name="pt") 
-        .Double()
-        .fill(
-            pt=np.abs(ak.flatten(obj.eta)),
-            )
-        )
-    
-    return hist
+    return make_hist(obj, [var_axis("pt", pt_bins)])
 
     
 
 def make_1d_eta_hist(obj): #also intended to be rebinned later
-        
-    hist = (
-        dah.Hist.new
-        .Regular(300, 0, 3, name="eta") #300 (0.01) bins between 0 and 3 |η|
-        .Double()
-        .fill(
-            eta=np.abs(ak.flatten(obj.eta)),
-            )
-        )
-    
-    return hist
+
+    return make_hist(obj, [reg_axis("eta", 300, 0, 3, absolute=True)]) #300 (0.01) bins between 0 and 3 |η|
     
 
 def make_1d_eta_hist_var(obj, eta_bins):
 
     #eta_bins = [0, 0.8, 1.442, 2.5, 2.8]
-    
-    hist = (
-        dah.Hist.new
-        .Variable(eta_bins, name="eta") 
-        .Double()
-        .fill(
-            eta=np.abs(ak.flatten(obj.eta)),
-            )
-        )
-    
-    return hist
+
+    return make_hist(obj, [var_axis("eta", eta_bins, absolute=True)])
 
 
 ###################
@@ -84,30 +401,10 @@ def make_1d_eta_hist_var(obj, eta_bins):
 
 def make_2d_hist(obj, var1_binning, var2_binning, var1_name = "pt", var2_name = "eta"):
 
-    obj_var1 = getattr(obj, var1_name)
-    obj_var2 = getattr(obj, var2_name)
-
-    #var1_binning = [ 1, 2, 3, 4, 5,
-    #            6, 7, 8, 9, 10,
-    #            11, 12, 13, 14, 15,
-    #            16, 17, 18, 19, 20]
-    
     # can rebin later like:
     # hist[:, :10] → selects the first 10 bins in the second axis
-    
-    hist = (
-        dah.Hist.new
-        .Variable(var1_binning, name=var1_name, label=var1_name)
-        .Variable(var2_binning, name=var2_name, label=var2_name)
-        .Double()
-        .fill(
-            #eta=np.abs(ak.flatten(obj.eta)),
-            **{var1_name: ak.flatten(obj_var1),
-               var2_name: ak.flatten(obj_var2)}
-            )
-        )
-    
-    return hist
+
+    return make_hist(obj, [var_axis(var1_name, var1_binning), var_axis(var2_name, var2_binning)])
 
 
 ############################
@@ -116,31 +413,7 @@ def make_2d_hist(obj, var1_binning, var2_binning, var1_name = "pt", var2_name =
 
 def make_1d_hist_var_cat(obj, var_binning, cat_binning, var_name = "pt", cat_name="genPartFlav"):
 
-    obj_var = getattr(obj, var_name)
-    obj_cat = getattr(obj, cat_name)
-
-    #var1_binning = [ 1, 2, 3, 4, 5,
-    #            6, 7, 8, 9, 10,
-    #            11, 12, 13, 14, 15,
-    #            16, 17, 18, 19, 20]
-    
-    # can rebin later like:
-    # hist[:, :10] → selects the first 10 bins in the second axis
-    
-    hist = (
-        dah.Hist.new
-        .Variable(var_binning, name=var_name, label=var_name)
-        .IntCat(cat_binning, name=cat_name)
-        .Double()
-        .fill(
-            #eta=np.abs(ak.flatten(obj.eta)),
-            **{var_name: ak.flatten(obj_var),
-               cat_name:ak.flatten(obj_cat)
-            }
-            )
-        )
-    
-    return hist
+    return make_hist(obj, [var_axis(var_name, var_binning), cat_axis(cat_name, cat_binning)])
     
 """
 These are an extension of the above 1D histograms, they have addtional axis known as 'categories'.
@@ -156,34 +429,11 @@ categories are very general, can be whatever. If you want to make a selection of
 
 def make_2d_hist_cat(obj, var1_binning, var2_binning, cat_binning, var1_name = "pt", var2_name = "eta", cat_name="genPartFlav"):
 
-    obj_var1 = getattr(obj, var1_name)
-    obj_var2 = getattr(obj, var2_name)
-    obj_cat = getattr(obj, cat_name)
-
-    #var1_binning = [ 1, 2, 3, 4, 5,
-    #            6, 7, 8, 9, 10,
-    #            11, 12, 13, 14, 15,
-    #            16, 17, 18, 19, 20]
-    
-    # can rebin later like:
-    # hist[:, :10] → selects the first 10 bins in the second axis
-    
-    hist = (
-        dah.Hist.new
-        .Variable(var1_binning, name=var1_name, label=var1_name)
-        .Variable(var2_binning, name=var2_name, label=var2_name)
-        .IntCat(cat_binning, name=cat_name)
-        .Double()
-        .fill(
-            #eta=np.abs(ak.flatten(obj.eta)),
-            **{var1_name: ak.flatten(obj_var1),
-               var2_name: ak.flatten(obj_var2),
-               cat_name:ak.flatten(obj_cat)
-            }
-            )
-        )
-    
-    return hist
+    return make_hist(obj, [
+        var_axis(var1_name, var1_binning),
+        var_axis(var2_name, var2_binning),
+        cat_axis(cat_name, cat_binning),
+    ])
 
 
 ###############################
@@ -205,41 +455,11 @@ def make_1d2d_hist_reg_cat(
     Create a 1D x 2D histogram with one numeric variable (and regular ((interpolated)) binning) and two integer categories (typically gen and quality).
     """
 
-    # Extract variables and categories from the object
-    obj_var = getattr(obj, var_name)
-    
-    obj_cat1 = getattr(obj, cat1_name)
-    obj_cat2 = getattr(obj, cat2_name)
-
-    # take absolute value if needed (like for eta or phi, maybe)
-    if var_abs:
-        obj_var = np.abs(obj_var)
-
-    # flatten arrays, store in dict to be deconstructed later in the fill method
-    flat_vars = {
-        var_name: ak.flatten(obj_var),
-        cat1_name: ak.flatten(obj_cat1),
-        cat2_name: ak.flatten(obj_cat2)
-    }
-
-    bins = reg_binning[0]
-    start = reg_binning[1]
-    end = reg_binning[2]
-
-    bins, start, stop = reg_binning
-
-    hist = (
-        dah.Hist.new
-        .Reg(bins, start, stop, name=var_name, label=var_name)
-        .IntCat(cat1_binning, name=cat1_name)
-        .IntCat(cat2_binning, name=cat2_name)
-        .Double()
-    )
-
-    # deconstruct dict, it just works
-    hist.fill(**flat_vars) 
-
-    return hist
+    return make_hist(obj, [
+        reg_axis(var_name, *reg_binning, absolute=var_abs),
+        cat_axis(cat1_name, cat1_binning),
+        cat_axis(cat2_name, cat2_binning),
+    ])
 
 def make_1d2d_hist_reg_cat_weighted(
     obj,
@@ -250,50 +470,19 @@ def make_1d2d_hist_reg_cat_weighted(
     cat1_name="gen_tag",
     cat2_name="qual_tag",
     var_abs=False,
+    weight="Weight",
     ):
     
     """
-    Create a 1D x 2D histogram with one numeric variable (and regular ((interpolated)) binning) and two integer categories (typically gen and quality).
+    Weighted version of make_1d2d_hist_reg_cat. weight is the name of a weight field of obj, a jagged array like obj
+    or one weight per event (like events.genWeight * scale); the hist has Weight storage (sum of weights and of squares).
     """
 
-    # Extract variables and categories from the object
-    obj_var = getattr(obj, var_name)
-    
-    obj_cat1 = getattr(obj, cat1_name)
-    obj_cat2 = getattr(obj, cat2_name)
-    weight = getattr(obj, "Weight")
-
-    # take absolute value if needed (like for eta or phi, maybe)
-    if var_abs:
-        obj_var = np.abs(obj_var)
-
-    # flatten arrays, store in dict to be deconstructed later in the fill method
-    flat_vars = {
-        var_name: ak.flatten(obj_var),
-        cat1_name: ak.flatten(obj_cat1),
-        cat2_name: ak.flatten(obj_cat2),
-        weight:    ak.flatten(weight)
-    }
-
-    bins = reg_binning[0]
-    start = reg_binning[1]
-    end = reg_binning[2]
-
-    bins, start, stop = reg_binning
-
-    hist = (
-        dah.Hist.new
-        .Reg(bins, start, stop, name=var_name, label=var_name)
-        .IntCat(cat1_binning, name=cat1_name)
-        .IntCat(cat2_binning, name=cat2_name)
-        .Weight(obj_weight)
-        .Double()
-    )
-
-    # deconstruct dict, it just works
-    hist.fill(**flat_vars) 
-
-    return hist
+    return make_hist(obj, [
+        reg_axis(var_name, *reg_binning, absolute=var_abs),
+        cat_axis(cat1_name, cat1_binning),
+        cat_axis(cat2_name, cat2_binning),
+    ], weight=weight)
 
     
 def make_1d2d_hist_var_cat(
@@ -311,35 +500,11 @@ def make_1d2d_hist_var_cat(
     Create a 1D x 2D histogram with one numeric variable and two integer categories (typically gen and quality).
     """
 
-    # Extract variables and categories from the object
-    obj_var = getattr(obj, var_name)
-    
-    obj_cat1 = getattr(obj, cat1_name)
-    obj_cat2 = getattr(obj, cat2_name)
-
-    # take absolute value if needed (like for eta or phi, maybe)
-    if var_abs:
-        obj_var = np.abs(obj_var)
-
-    # flatten arrays, store in dict to be deconstructed later in the fill method
-    flat_vars = {
-        var_name: ak.flatten(obj_var),
-        cat1_name: ak.flatten(obj_cat1),
-        cat2_name: ak.flatten(obj_cat2)
-    }
-
-    hist = (
-        dah.Hist.new
-        .Variable(var_binning, name=var_name, label=var_name)
-        .IntCat(cat1_binning, name=cat1_name)
-        .IntCat(cat2_binning, name=cat2_name)
-        .Double()
-    )
-
-    # deconstruct dict, it just works
-    hist.fill(**flat_vars) 
-
-    return hist
+    return make_hist(obj, [
+        var_axis(var_name, var_binning, absolute=var_abs),
+        cat_axis(cat1_name, cat1_binning),
+        cat_axis(cat2_name, cat2_binning),
+    ])
 
 ###############################
 ## 2Dx2D Category Histograms ##
@@ -363,39 +528,12 @@ def make_2d2d_hist_cat(
     Create a 2D x 2D histogram with two numeric variables and two integer categories (typically gen and quality).
     """
 
-    # Extract variables and categories from the object
-    obj_var1 = getattr(obj, var1_name)
-    obj_var2 = getattr(obj, var2_name)
-    obj_cat1 = getattr(obj, cat1_name)
-    obj_cat2 = getattr(obj, cat2_name)
-
-    # take absolute value if needed (like for eta or phi, maybe)
-    if var1_abs:
-        obj_var1 = np.abs(obj_var1)
-    if var2_abs:
-        obj_var2 = np.abs(obj_var2)
-
-    # flatten arrays, store in dict to be deconstructed later in the fill method
-    flat_vars = {
-        var1_name: ak.flatten(obj_var1),
-        var2_name: ak.flatten(obj_var2),
-        cat1_name: ak.flatten(obj_cat1),
-        cat2_name: ak.flatten(obj_cat2)
-    }
-
-    hist = (
-        dah.Hist.new
-        .Variable(var1_binning, name=var1_name, label=var1_name)
-        .Variable(var2_binning, name=var2_name, label=var2_name)
-        .IntCat(cat1_binning, name=cat1_name)
-        .IntCat(cat2_binning, name=cat2_name)
-        .Double()
-    )
-
-    # deconstruct dict, it just works
-    hist.fill(**flat_vars) 
-
-    return hist
+    return make_hist(obj, [
+        var_axis(var1_name, var1_binning, absolute=var1_abs),
+        var_axis(var2_name, var2_binning, absolute=var2_abs),
+        cat_axis(cat1_name, cat1_binning),
+        cat_axis(cat2_name, cat2_binning),
+    ])
 
 def make_2d2d_hist_cat_1reg(
     obj,
@@ -412,43 +550,16 @@ def make_2d2d_hist_cat_1reg(
     ):
     
     """
-    Create a 2D x 2D histogram with two numeric variables and two integer categories (typically gen and quality).
+    Create a 2D x 2D histogram with two numeric variables (the second with regular binning, [bins, start, stop])
+    and two integer categories (typically gen and quality).
     """
 
-    # Extract variables and categories from the object
-    obj_var1 = getattr(obj, var1_name)
-    obj_var2 = getattr(obj, var2_name)
-    obj_cat1 = getattr(obj, cat1_name)
-    obj_cat2 = getattr(obj, cat2_name)
-
-    # take absolute value if needed (like for eta or phi, maybe)
-    if var1_abs:
-        obj_var1 = np.abs(obj_var1)
-    if var2_abs:
-        obj_var2 = np.abs(obj_var2)
-
-    # flatten arrays, store in dict to be deconstructed later in the fill method
-    flat_vars = {
-        var1_name: ak.flatten(obj_var1),
-        var2_name: ak.flatten(obj_var2),
-        cat1_name: ak.flatten(obj_cat1),
-        cat2_name: ak.flatten(obj_cat2)
-    }
-
-    bins, start, stop = var2_binning
-    hist = (
-        dah.Hist.new
-        .Variable(var1_binning, name=var1_name, label=var1_name)
-        .Reg(bins, start, stop, name=var2_name, label=var2_name)
-        .IntCat(cat1_binning, name=cat1_name)
-        .IntCat(cat2_binning, name=cat2_name)
-        .Double()
-    )
-
-    # deconstruct dict, it just works
-    hist.fill(**flat_vars)
-
-    return hist
+    return make_hist(obj, [
+        var_axis(var1_name, var1_binning, absolute=var1_abs),
+        reg_axis(var2_name, *var2_binning, absolute=var2_abs),
+        cat_axis(cat1_name, cat1_binning),
+        cat_axis(cat2_name, cat2_binning),
+    ])
 
 def make_2d2d_hist_cat_2reg(
     obj,
@@ -465,42 +576,173 @@ def make_2d2d_hist_cat_2reg(
     ):
     
     """
-    Create a 2D x 2D histogram with two numeric variables and two integer categories (typically gen and quality).
+    Create a 2D x 2D histogram with two numeric variables (both with regular binning, [bins, start, stop])
+    and two integer categories (typically gen and quality).
     """
 
-    # Extract variables and categories from the object
-    obj_var1 = getattr(obj, var1_name)
-    obj_var2 = getattr(obj, var2_name)
-    obj_cat1 = getattr(obj, cat1_name)
-    obj_cat2 = getattr(obj, cat2_name)
+    return make_hist(obj, [
+        reg_axis(var1_name, *var1_binning, absolute=var1_abs),
+        reg_axis(var2_name, *var2_binning, absolute=var2_abs),
+        cat_axis(cat1_name, cat1_binning),
+        cat_axis(cat2_name, cat2_binning),
+    ])
+
 
-    # take absolute value if needed (like for eta or phi, maybe)
-    if var1_abs:
-        obj_var1 = np.abs(obj_var1)
-    if var2_abs:
-        obj_var2 = np.abs(obj_var2)
+##############################
+## VID Cutflow Histograms   ##
+##############################
+
+def make_vid_cutflow_hist(ele_obj, pt_binning, eta_binning):
+
+    """
+    One histogram holding the N-1 and cumulative pass counts of every cutBasedID cut at every level,
+    axes (pt, |eta|, cut, level, pattern). cut indexes VID_CUTS, level is 1 (veto) ... 4 (tight),
+    pattern is the PASS_* bitmask from vid_unpacked. Each electron fills one entry per (cut, level).
+    """
+
+    patterns = vid_cutflow_patterns(ele_obj) # var * 4 levels * 10 cuts, decoded once
+
+    level = ak.local_index(patterns, axis=2)[:, :, :, np.newaxis] + 1
+    cut = ak.local_index(patterns, axis=3)
+    pt, abs_eta, level, cut, patterns = ak.broadcast_arrays(ele_obj.pt, np.abs(ele_obj.eta), level, cut, patterns)
 
-    # flatten arrays, store in dict to be deconstructed later in the fill method
     flat_vars = {
-        var1_name: ak.flatten(obj_var1),
-        var2_name: ak.flatten(obj_var2),
-        cat1_name: ak.flatten(obj_cat1),
-        cat2_name: ak.flatten(obj_cat2)
+        "pt": ak.flatten(pt, axis=None),
+        "eta": ak.flatten(abs_eta, axis=None),
+        "cut": ak.flatten(cut, axis=None),
+        "level": ak.flatten(level, axis=None),
+        "pattern": ak.flatten(patterns, axis=None),
+    }
+
+    hist = (
+        dah.Hist.new
+        .Variable(pt_binning, name="pt", label="pt")
+        .Variable(eta_binning, name="eta", label="eta")
+        .IntCat(list(range(len(VID_CUTS))), name="cut")
+        .IntCat([1, 2, 3, 4], name="level")
+        .IntCat(list(range(8)), name="pattern")
+        .Double()
+    )
+
+    hist.fill(**flat_vars)
+
+    return hist
+
+
+
+def make_quality_scan_hist(obj, era, collection, pt_binning, sip3d_cuts, iso_cuts=None):
+
+    """
+    Gold/silver/bronze split at a whole grid of working points in one pass, axes (pt, iso_cut, sip3d_cut, qual_tag).
+    Each lepton fills one entry per (iso_cut, sip3d_cut) pair with the qual_tag it gets there, e.g.
+    h[{"iso_cut": hist.loc(4), "sip3d_cut": hist.loc(3)}] is what lep_tagger gives with global_sip3d = 3.
+    The cut values must be increasing; iso_cuts defaults to the spec value (lep_specs "params").
+    """
+
+    if iso_cuts is None:
+        iso_cuts = [compile_spec(era, collection).params["iso_cut"]]
+
+    for name, cuts in (("sip3d_cuts", sip3d_cuts), ("iso_cuts", iso_cuts)):
+        if list(cuts) != sorted(set(cuts)):
+            sys.exit(f'{name} must be strictly increasing, got {list(cuts)}')
+
+    scan = scan_quality_from_spec(obj, era, collection, sip3d_cuts, iso_cuts) # var * iso * sip3d
+    pt, qual_tag, iso_cut, sip3d_cut = ak.broadcast_arrays(obj.pt, scan.qual_tag, scan.iso_cut, scan.sip3d_cut)
+
+    flat_vars = {
+        "pt": ak.flatten(pt, axis=None),
+        "iso_cut": ak.flatten(iso_cut, axis=None),
+        "sip3d_cut": ak.flatten(sip3d_cut, axis=None),
+        "qual_tag": ak.flatten(qual_tag, axis=None),
     }
 
-    bins1, start1, stop1 = var1_binning
-    bins2, start2, stop2 = var2_binning
-    
     hist = (
         dah.Hist.new
-        .Reg(bins1, start1, stop1, name=var1_name, label=var1_name)
-        .Reg(bins2, start2, stop2, name=var2_name, label=var2_name)
-        .IntCat(cat1_binning, name=cat1_name)
-        .IntCat(cat2_binning, name=cat2_name)
+        .Variable(pt_binning, name="pt", label="pt")
+        .Variable(_threshold_edges(iso_cuts), name="iso_cut", label="iso cut")
+        .Variable(_threshold_edges(sip3d_cuts), name="sip3d_cut", label="sip3d cut")
+        .IntCat(sorted(QUAL_TAGS.values()), name="qual_tag")
         .Double()
     )
 
-    # deconstruct dict, it just works
     hist.fill(**flat_vars)
 
-    return hist
\ No newline at end of file
+    return hist
+
+
+def _threshold_edges(cuts):
+    # one bin per cut value, starting at it: [c0, c1), [c1, c2), ..., [cn, cn + last step)
+    cuts = [float(cut) for cut in cuts]
+    step = cuts[-1] - cuts[-2] if len(cuts) > 1 else 1.0
+
+    return cuts + [cuts[-1] + step]
+
+
+
+##############################
+## Gen Acceptance Histograms ##
+##############################
+
+def make_gen_acceptance_hist(gen_leptons, pt_binning, eta_binning):
+
+    """
+    Prompt gen leptons (taggers.gen_acceptance.gen_leptons) per mass point, axes (m_parent, m_lsp, flavour,
+    in_acceptance, pt, |eta|). The mass axes grow with the mass points found, so chunks of a grid merge by adding.
+    """
+
+    return make_hist(gen_leptons, [
+        cat_axis("m_parent", [], label="parent mass", growth=True),
+        cat_axis("m_lsp", [], label="LSP mass", growth=True),
+        cat_axis("flavour", [11, 13]),
+        bool_axis("in_acceptance"),
+        var_axis("pt", pt_binning),
+        var_axis("eta", eta_binning, absolute=True),
+    ])
+
+
+def make_gen_multiplicity_hist(gen_leptons, mass_points, max_leptons=5):
+
+    """
+    Events per mass point by their number of prompt gen electrons and muons inside the acceptance,
+    axes (m_parent, m_lsp, n_ele, n_muon). mass_points is the event-level record of gen_leptons' events.
+    The dilepton acceptance of a mass point is h[{"m_parent": ..., "m_lsp": ...}] summed over n_ele + n_muon >= 2,
+    divided by the total.
+    """
+
+    accepted = gen_leptons.in_acceptance
+
+    flat_vars = {
+        "m_parent": mass_points.m_parent,
+        "m_lsp": mass_points.m_lsp,
+        "n_ele": ak.sum(accepted & (gen_leptons.flavour == 11), axis=1),
+        "n_muon": ak.sum(accepted & (gen_leptons.flavour == 13), axis=1),
+    }
+
+    hist = (
+        dah.Hist.new
+        .IntCat([], name="m_parent", label="parent mass", growth=True)
+        .IntCat([], name="m_lsp", label="LSP mass", growth=True)
+        .Integer(0, max_leptons, name="n_ele", label="accepted electrons")
+        .Integer(0, max_leptons, name="n_muon", label="accepted muons")
+        .Double()
+    )
+
+    hist.fill(**flat_vars)
+
+    return hist
+
+
+def make_gen_efficiency_hist(gen_leptons, pt_binning, eta_binning):
+
+    """
+    Prompt gen leptons (taggers.gen_acceptance.gen_leptons) with their 'reco_qual_tag' (gen_filter.matched_reco_quality),
+    axes (flavour, in_acceptance, reco_qual_tag, pt, |eta|): the denominator of the reco efficiency is every category.
+    """
+
+    return make_hist(gen_leptons, [
+        cat_axis("flavour", [11, 13]),
+        bool_axis("in_acceptance"),
+        cat_axis("reco_qual_tag", [NO_RECO_MATCH] + sorted(QUAL_TAGS.values())),
+        var_axis("pt", pt_binning),
+        var_axis("eta", eta_binning, absolute=True),
+    ])
@@ -57,11 +57,14 @@ def tag_and_combine_ele(electron, lowptelectron):
 
 
 
-def poster_plots_dict(obj):
+def poster_plots_dict(obj, weight=None):
     
     """
     structure will be a dict with lots of hists of various configurations
+    weight: None (counts), or per-event or per-object weights, see histers.make_hist
     """
+
+    obj = FlatColumns(obj) # pt, |eta|, gen_tag, ... flattened once and shared by all the hists below
     
     ##############
     # fill hists #
@@ -70,38 +73,19 @@ def poster_plots_dict(obj):
     gens = [-10, 10, 11, 12, 13] #I added 1 in front for gens so I know I don't accidentally get it mixed up with qual
     quals = [-1,1,2,3]
     
-    pt_eta_gen_qual = make_2d2d_hist_cat(
-        obj,                           
-        [2,3,4,5,7,10,20,45,75,1000], 
-        [0,0.8,1.4442,1.556,2.5],
-        cat1_binning = gens,
-        cat2_binning = quals,
-        var1_name = 'pt',
-        var2_name = 'eta',
-        cat1_name='gen_tag',
-        cat2_name='qual_tag',
-        var2_abs=True
-       )
-
-    pt_gen_qual = make_1d2d_hist_reg_cat(
-    obj,
-    [80,0,20], #like [100, 0, 100] 100 bins between 0 and 100
-    cat1_binning = gens,
-    cat2_binning = quals,
-    var_name="pt",
-    cat1_name="gen_tag",
-    cat2_name="qual_tag",
-    var_abs=False,
-    )
-
-    ################
-    # fill results #
-    ###############
-
-    results = {
-        "pt_eta_gen_qual_hist": pt_eta_gen_qual,
-        "pt_gen_qual_hist": pt_gen_qual,
-    }
+    results = make_hists(obj, { # one pass, gen_tag and qual_tag binned once for both
+        "pt_eta_gen_qual_hist": [
+            var_axis("pt", [2,3,4,5,7,10,20,45,75,1000]),
+            var_axis("eta", [0,0.8,1.4442,1.556,2.5], absolute=True),
+            cat_axis("gen_tag", gens),
+            cat_axis("qual_tag", quals),
+        ],
+        "pt_gen_qual_hist": [
+            reg_axis("pt", 80, 0, 20), # 80 bins between 0 and 20
+            cat_axis("gen_tag", gens),
+            cat_axis("qual_tag", quals),
+        ],
+    }, weight=weight)
 
     return results
 
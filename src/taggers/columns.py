@@ -0,0 +1,67 @@
+# Registry of the NanoAOD columns each tagger reads
+#
+# Taggers declare what they touch with declare_columns, the processor asks for the union and preloads exactly those
+# branches in one bulk read per chunk (coffea's "preload" fileset option), instead of reading them lazily one by one:
+#
+#   import lep_tagger as tagger
+#   fileset = add_preload(fileset, tagger.tag_ele, tagger.tag_muon, extra={"MET": ["pt"]})
+
+TAGGER_COLUMNS = {} # "module.function" -> {collection: set of fields}
+
+
+def _key(tagger):
+    return tagger if isinstance(tagger, str) else f"{tagger.__module__}.{tagger.__name__}"
+
+
+def declare_columns(tagger, *sources, **collections):
+    """
+    Register the columns tagger reads. sources are other declared taggers (their columns get included)
+    or {collection: fields} dicts, collections are given as keywords, e.g.
+
+    declare_columns(tag_ele, tag_ele_quality, tag_gen_columns("Electron"), Electron=["pt"])
+    """
+    columns = {}
+    for source in sources + (collections,):
+        source = source if isinstance(source, dict) else TAGGER_COLUMNS[_key(source)]
+        for collection, fields in source.items():
+            columns.setdefault(collection, set()).update(fields)
+
+    TAGGER_COLUMNS[_key(tagger)] = columns
+
+    return tagger
+
+
+def required_columns(*taggers, extra=None):
+    """
+    Union of the columns of the given taggers (functions or "module.function" names), as {collection: sorted fields}
+    """
+    union = {}
+    for source in [TAGGER_COLUMNS[_key(tagger)] for tagger in taggers] + [extra or {}]:
+        for collection, fields in source.items():
+            union.setdefault(collection, set()).update(fields)
+
+    return {collection: sorted(fields) for collection, fields in sorted(union.items())}
+
+
+def required_branches(*taggers, extra=None):
+    """
+    The flat NanoAOD branch names behind required_columns, counters included (nElectron, Electron_pt, ...)
+    """
+    branches = set()
+    for collection, fields in required_columns(*taggers, extra=extra).items():
+        branches.add(f"n{collection}")
+        branches.update(f"{collection}_{field}" for field in fields)
+
+    return sorted(branches)
+
+
+def add_preload(fileset, *taggers, extra=None):
+    """
+    Return a copy of a coffea fileset with every dataset set to preload the branches the taggers need
+    """
+    branches = required_branches(*taggers, extra=extra)
+
+    return {
+        dataset: {**info, "preload": sorted(set(info.get("preload", [])) | set(branches))}
+        for dataset, info in fileset.items()
+    }
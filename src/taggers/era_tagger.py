@@ -0,0 +1,142 @@
+# The lepton tagger functions of one era, shared by lep_tagger (preUL) and lep_tagger_UL (UL)
+#
+# The selections of an era live in lep_specs.LEP_SPECS[era], so a new era is a new spec plus a module binding ERA:
+#
+#   ERA = "UL"
+#   global_sip3d = 3
+#   use_jit = False
+#   _taggers = era_taggers(__name__) # then tag_ele = _taggers["tag_ele"], ...
+#
+# The functions read ERA, global_sip3d and use_jit from that module when called, so "switch flipping"
+# (lep_tagger_UL.global_sip3d = 4) keeps working, and they belong to that module (declare_columns names,
+# tag_cache tagger versions).
+
+import sys
+
+import numpy as np
+
+from .columns import declare_columns
+from .flat_kernels import concatenate_view
+from .gen_tagger import tag_gen, tag_gen_columns
+from .lepton_table import lepton_table
+from .spec_tagger import add_cached_columns, spec_columns, tag_quality_from_spec
+
+
+ACCEPTABLE_IDS = ['ele', 'electron', 'lpte', 'lowptelectron', 'mu', 'muon']
+
+
+def era_taggers(module_name):
+    """
+    {name: function} of the taggers (tag_ele, tag_lpte, tag_muon, tag_qual, tag_*_quality, tag_and_combine_ele,
+    tag_leptons, lpte_sip3d) of the era set as ERA in module module_name, with their columns declared
+    """
+    module = sys.modules[module_name]
+    era = module.ERA
+
+    def tag_qual(obj, ID, packed=False):
+
+        ID_lower = ID.lower()
+
+        if ID_lower not in ACCEPTABLE_IDS:
+            sys.exit(f'ID {ID} not acceptable, must be in {ACCEPTABLE_IDS}')
+
+        if ID_lower in ['ele', 'electron']:
+            obj = tag_ele_quality(obj, packed)
+        elif ID_lower in ['lpte', 'lowptelectron']:
+            obj = tag_lpte_quality(obj, packed)
+        elif ID_lower in ['mu', 'muon']:
+            obj = tag_muon_quality(obj, packed)
+
+        return obj
+
+    def tag_ele(ele, packed=False):
+
+        return tag_qual(tag_gen(ele, 'ele'), 'ele', packed)
+
+    def tag_lpte(lpte, packed=False):
+
+        return tag_qual(tag_gen(lpte, 'lpte'), 'lpte', packed)
+
+    def tag_muon(muon, packed=False):
+
+        return tag_qual(tag_gen(muon, 'muon'), 'muon', packed)
+
+    def tag_and_combine_ele(electron, lowptelectron):
+
+        # pt split first, so electrons that don't make it into the merged collection are never tagged
+        tagged_ele = tag_ele(electron[electron.pt >= 7])
+        tagged_lpte = tag_lpte(lowptelectron[lowptelectron.pt < 7])
+
+        return concatenate_view(tagged_ele, tagged_lpte) # same as ak.concatenate(..., axis=1), without copying the fields
+
+    def tag_leptons(electron, muon, lowptelectron=None, gen=None):
+
+        """
+        Tag Electron, Muon (and LowPtElectron, pt split like tag_and_combine_ele) in one go and return a single
+        lepton table with the LEPTON_SCHEMA fields (pt, eta, phi, mass, charge, flavour, gen_tag, qual_tag, source,
+        source_idx) instead of concatenating the tagged collections. gen=False for data (default: is_mc of the fileset metadata).
+        """
+
+        return lepton_table(electron, muon, lowptelectron, era=era, sip3d_cut=module.global_sip3d, jit=module.use_jit, gen=gen)
+
+    def tag_ele_quality(ele, packed=False):  # use on raw Electron collection (Awkward/NanoEvents)
+
+        """
+        Add 'isBaseline', 'isGold', 'isSilver', 'isBronze' boolean fields and the 'qual_tag' to each electron.
+        packed=True stores them in one uint8 'qual_flags' field instead, see spec_tagger.tag_quality_from_spec and quality.attach_quality
+        """
+
+        return tag_quality_from_spec(ele, era, 'ele', sip3d_cut=module.global_sip3d, packed=packed, jit=module.use_jit)
+
+    def tag_lpte_quality(lpte, packed=False): #use on raw lpte collection
+
+        """
+        Add an 'isBaseline', 'isGold', 'isSilver', 'isBronze' field and the 'qual_tag' to each LowPtElectron based on cuts.
+        packed=True stores them in one uint8 'qual_flags' field instead, see spec_tagger.tag_quality_from_spec and quality.attach_quality
+        """
+
+        return tag_quality_from_spec(lpte, era, 'lpte', sip3d_cut=module.global_sip3d, packed=packed, jit=module.use_jit)
+
+    def tag_muon_quality(muon, packed=False): #use on raw muon collection
+
+        """
+        Add 'isBaseline', 'isGold', 'isSilver', 'isBronze' boolean fields and the 'qual_tag' to each muon.
+        packed=True stores them in one uint8 'qual_flags' field instead, see spec_tagger.tag_quality_from_spec and quality.attach_quality
+        """
+
+        return tag_quality_from_spec(muon, era, 'muon', sip3d_cut=module.global_sip3d, packed=packed, jit=module.use_jit)
+
+    def lpte_sip3d(lpte):
+
+        # sqrt of the squared SIP3D the lpte selection caches on the collection ('sip3d2', see lep_specs), taken only here
+
+        return np.sqrt(add_cached_columns(lpte, era, 'lpte').sip3d2)
+
+    taggers = {
+        function.__name__: function for function in (
+            tag_qual, tag_ele, tag_lpte, tag_muon, tag_and_combine_ele, tag_leptons,
+            tag_ele_quality, tag_lpte_quality, tag_muon_quality, lpte_sip3d,
+        )
+    }
+    for function in taggers.values():
+        function.__module__ = module_name
+        function.__qualname__ = function.__name__
+
+    # columns read by the taggers, see columns.py (add_preload / required_branches)
+    declare_columns(tag_ele_quality, Electron=spec_columns(era, 'ele'))
+    declare_columns(tag_lpte_quality, LowPtElectron=spec_columns(era, 'lpte'))
+    declare_columns(tag_muon_quality, Muon=spec_columns(era, 'muon'))
+
+    declare_columns(tag_ele, tag_ele_quality, tag_gen_columns("Electron"))
+    declare_columns(tag_lpte, tag_lpte_quality, tag_gen_columns("LowPtElectron"))
+    declare_columns(tag_muon, tag_muon_quality, tag_gen_columns("Muon"))
+
+    declare_columns(tag_and_combine_ele, tag_ele, tag_lpte)
+    declare_columns(
+        tag_leptons, tag_ele, tag_muon, tag_lpte,
+        Electron=["pt", "eta", "phi", "mass", "charge"],
+        Muon=["pt", "eta", "phi", "mass", "charge"],
+        LowPtElectron=["pt", "eta", "phi", "mass", "charge"],
+    )
+
+    return taggers
@@ -0,0 +1,152 @@
+# Helpers for running plain numpy code on the flat content of jagged columns
+#
+# Jagged per-object columns (Electron.pt, Muon.sip3d, ...) are one flat buffer plus per-event counts.
+# Doing the math on the flat numpy buffers skips the per-step jagged bookkeeping, and the event
+# structure only gets rebuilt once at the end. Works on eager (virtual) and dask-awkward collections.
+
+from functools import wraps
+
+import awkward as ak
+import numpy as np
+
+
+def is_dask(array):
+    return type(array).__module__.startswith("dask_awkward")
+
+
+def flat_numpy(column):
+    """
+    The flat numpy content of a jagged (var * number) column
+    """
+    return ak.to_numpy(ak.flatten(column, axis=1))
+
+
+def unflatten_like(flat, column):
+    """
+    Give a flat per-object array the event structure of column
+    """
+    return ak.unflatten(flat, ak.num(column, axis=1))
+
+
+def lazy_like(column, dtype, fill):
+    """
+    Jagged column with the event structure of column whose flat values come from fill(number of objects),
+    called when the values are first read. Only the counts of column are read now (eager arrays only)
+    """
+    offsets = ak.to_layout(column).to_ListOffsetArray64(True).offsets.data
+    form = ak.forms.ListOffsetForm("i64", ak.forms.NumpyForm(np.dtype(dtype).name, form_key="data"), form_key="offsets")
+
+    return ak.from_buffers(
+        form, len(offsets) - 1,
+        {"offsets-offsets": offsets, "data-data": lambda: fill(int(offsets[-1]))},
+        backend="cpu", allow_noncanonical_form=True,
+    )
+
+
+def per_partition(label):
+    """
+    Decorator for functions of awkward arrays written for eager arrays (numpy inside): every positional argument
+    is an array, keyword arguments are passed through. On dask-awkward input the function runs per partition
+    (dak.map_partitions, label names the tasks: a string or label(keyword arguments)); on typetracers, when dask
+    only asks for the output type, it runs on empty arrays with all inputs touched, so none of them is pruned.
+    Select the fields a function reads before calling it, the others stay prunable.
+    """
+    def decorate(function):
+
+        @wraps(function)
+        def wrapper(*arrays, **kwargs):
+            if any(is_dask(array) for array in arrays):
+                import dask_awkward as dak
+
+                return dak.map_partitions(wrapper, *arrays, label=label(kwargs) if callable(label) else label, **kwargs)
+
+            if ak.backend(*arrays) == "typetracer":
+                for array in arrays:
+                    ak.typetracer.touch_data(array)
+                result = function(*(ak.typetracer.length_zero_if_typetracer(array) for array in arrays), **kwargs)
+                return ak.Array(result.layout.to_typetracer(forget_length=True), behavior=result.behavior)
+
+            return function(*arrays, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def map_flat(kernel, *columns, **kernel_kwargs):
+    """
+    Call kernel(*flat numpy columns, **kernel_kwargs) and unflatten what it returns (one row per object)
+    like the first column. A kernel returning a dict of flat arrays gives one record array with those fields.
+
+    All columns must belong to the same collection. On dask-awkward input this runs per partition.
+    """
+    return _map_flat(*columns, kernel=kernel, **kernel_kwargs)
+
+
+@per_partition(label=lambda kwargs: kwargs["kernel"].__name__.strip("_"))
+def _map_flat(*columns, kernel, **kernel_kwargs):
+
+    result = kernel(*(flat_numpy(column) for column in columns), **kernel_kwargs)
+
+    if isinstance(result, dict):
+        return unflatten_like(ak.zip(result), columns[0])
+    return unflatten_like(result, columns[0])
+
+
+def concatenate_view(first, second):
+    """
+    ak.concatenate([first, second], axis=1) of two jagged record collections (e.g. Electron and LowPtElectron),
+    built as a view: per-event offsets plus, for every merged object, which collection it comes from (union tags)
+    and where it sits in that collection's content (union index). No field is copied here; a field is gathered
+    from the two collections only when it is accessed. Selections made on the inputs (e.g. a pt cut) are
+    folded into the index, so only the selected objects are ever gathered.
+    """
+    if is_dask(first) or is_dask(second):
+        import dask_awkward as dak
+
+        return dak.map_partitions(concatenate_view, first, second, label="concatenate-view")
+
+    if ak.backend(first, second) == "typetracer":
+        return ak.concatenate([first, second], axis=1) # dask is only asking for the output type
+
+    counts, starts, indices, contents = [], [], [], []
+    for column in (first, second):
+        layout = ak.to_layout(column).to_ListOffsetArray64(False)
+        offsets = np.asarray(layout.offsets)
+
+        content = layout.content
+        if isinstance(content, ak.contents.IndexedArray): # a selection: point to the unselected records directly
+            index, content = np.asarray(content.index), content.content
+        else:
+            index = np.arange(len(content))
+
+        counts.append(np.diff(offsets))
+        starts.append(offsets[:-1])
+        indices.append(index)
+        contents.append(content)
+
+    total = counts[0] + counts[1]
+    offsets = np.zeros(len(total) + 1, dtype=np.int64)
+    np.cumsum(total, out=offsets[1:])
+
+    local = np.arange(offsets[-1]) - np.repeat(offsets[:-1], total) # position within the merged event
+    n_first = np.repeat(counts[0], total)
+    from_first = local < n_first
+
+    tags = (~from_first).astype(np.int8)
+    index = np.empty(len(tags), dtype=np.int64)
+    index[from_first] = indices[0][np.repeat(starts[0], total)[from_first] + local[from_first]]
+    index[~from_first] = indices[1][np.repeat(starts[1], total)[~from_first] + (local - n_first)[~from_first]]
+
+    union = ak.contents.UnionArray(ak.index.Index8(tags), ak.index.Index64(index), contents)
+
+    return ak.Array(ak.contents.ListOffsetArray(ak.index.Index64(offsets), union), behavior=first.behavior)
+
+
+@per_partition(label="broadcast-flat")
+def broadcast_flat(values, counts):
+    """
+    Per-event values (e.g. event weights) repeated once per object, flat: counts is ak.num of the collection.
+    Same as ak.flatten(ak.broadcast_arrays(values, collection)[0]) without building the jagged copy first.
+    """
+    return ak.Array(np.repeat(ak.to_numpy(values), ak.to_numpy(counts)))
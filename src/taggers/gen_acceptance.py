@@ -0,0 +1,81 @@
+# Generator-level signal acceptance, from GenPart and GenModel only
+#
+# For mass-point acceptance scans there is no reco object to tag: the prompt leptons are selected directly on GenPart
+# with the parent whitelist and gen kinematic thresholds of gen_filter.py, and every event gets the (parent, LSP)
+# masses of the GenModel flag it carries. Only the GenPart columns below and the GenModel flags are read.
+
+import re
+
+import awkward as ak
+import numpy as np
+
+from .columns import declare_columns
+from .flat_kernels import map_flat, per_partition
+from .gen_filter import GEN_ABS_ETA_MAX, GEN_PT_MIN, prompt_gen_mask
+
+
+MASS_POINT = re.compile(r"_(\d+)_(\d+)$") # GenModel flags like TChiWZ_ZToLL_300_290 -> (300, 290)
+NO_MASS_POINT = -1
+
+GEN_FLAVOURS = (11, 13)
+
+
+def mass_points(genmodel):
+    """
+    Record array with one entry per event: 'm_parent' and 'm_lsp' of the GenModel flag set in the event,
+    NO_MASS_POINT if none is. GenModel flags whose name does not end in _<mass>_<mass> are ignored (and not read).
+    """
+    flags = [name for name in genmodel.fields if MASS_POINT.search(name)]
+
+    return _mass_points(genmodel[flags] if flags else genmodel) # genmodel[[]] would select no events, not no fields
+
+
+@per_partition(label="mass-points")
+def _mass_points(genmodel):
+
+    m_parent = np.full(len(genmodel), NO_MASS_POINT, dtype=np.int32)
+    m_lsp = np.full(len(genmodel), NO_MASS_POINT, dtype=np.int32)
+
+    for name in genmodel.fields:
+        masses = MASS_POINT.search(name)
+        if masses is None:
+            continue
+        flag = ak.to_numpy(genmodel[name]).astype(bool)
+        m_parent[flag], m_lsp[flag] = int(masses.group(1)), int(masses.group(2))
+
+    return ak.zip({"m_parent": m_parent, "m_lsp": m_lsp})
+
+
+def gen_leptons(genpart, masses=None, ele_id="ele"):
+    """
+    Prompt gen electrons and muons (gen_filter.prompt_gen_mask) of GenPart, with 'flavour' (11 or 13) and
+    'in_acceptance' (gen pt/eta thresholds of the ele_id ("ele" or "lpte") or muon gen mask). With masses
+    (mass_points of the same events) the event's 'm_parent' and 'm_lsp' are added too.
+    Fields already set on genpart (e.g. 'reco_qual_tag') are kept.
+    """
+    leptons = genpart[prompt_gen_mask(genpart, GEN_FLAVOURS)]
+
+    acceptance = map_flat(_acceptance_kernel, leptons.pdgId, leptons.pt, leptons.eta, ele_pt_min=GEN_PT_MIN[ele_id])
+
+    leptons["flavour"] = acceptance.flavour
+    leptons["in_acceptance"] = acceptance.in_acceptance
+    if masses is not None:
+        leptons["m_parent"] = masses.m_parent
+        leptons["m_lsp"] = masses.m_lsp
+
+    return leptons
+
+
+def _acceptance_kernel(pdgid, pt, eta, ele_pt_min):
+
+    flavour = np.abs(pdgid).astype(np.int8)
+    pt_min = np.where(flavour == 11, ele_pt_min, GEN_PT_MIN["muon"])
+
+    return {
+        "flavour": flavour,
+        "in_acceptance": (pt > pt_min) & (np.abs(eta) < GEN_ABS_ETA_MAX),
+    }
+
+
+# GenModel flags have no counter and their names depend on the sample, they are not part of the declared columns
+declare_columns(gen_leptons, GenPart=["pdgId", "genPartIdxMother", "status", "pt", "eta"])
@@ -0,0 +1,99 @@
+# Per-chunk GenPart ancestry table, shared by the Electron, LowPtElectron and Muon gen tagging
+#
+# matched_gen.distinctParent goes through two NanoEvents cross-references per collection. Here the distinct
+# parent (first ancestor with a different pdgId, like coffea's distinctParent) of every gen particle is found
+# once per chunk with a compiled loop over genPartIdxMother, and the lepton collections just look their
+# matched particle up in it through genPartIdx.
+
+import weakref
+from collections import OrderedDict
+
+import awkward as ak
+import numpy as np
+
+from .flat_kernels import is_dask, map_flat
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+NO_PARENT = 0 # pdgId where there is no matched gen particle or no distinct parent (0 is no particle)
+
+_ANCESTRY = weakref.WeakKeyDictionary() # GenPart layout -> ancestry table, so one chunk builds it once
+_DASK_ANCESTRY = OrderedDict()          # same for dask, by collection name (every access is a new dask object), LRU
+DASK_ANCESTRY_SIZE = 16                 # dask graphs kept in _DASK_ANCESTRY
+
+
+def genpart_ancestry(genpart):
+    """
+    Record array with one entry per gen particle: 'distinctParentIdx' (index in the event's GenPart, -1 if none)
+    and 'distinctParentPdgId' (NO_PARENT if none). Built once per chunk, later calls return the same table.
+    """
+    cache, key = (_DASK_ANCESTRY, genpart.name) if is_dask(genpart) else (_ANCESTRY, genpart.layout)
+
+    if key not in cache:
+        cache[key] = map_flat(
+            _ancestry_kernel, genpart.genPartIdxMother, genpart.pdgId, ak.local_index(genpart.pdgId, axis=1),
+        )
+
+    if cache is _DASK_ANCESTRY:
+        cache.move_to_end(key)
+        while len(cache) > DASK_ANCESTRY_SIZE:
+            cache.popitem(last=False)
+
+    return cache[key]
+
+
+def matched_parent_pdgid(obj):
+    """
+    pdgId of the distinct parent of each object's matched gen particle (obj.matched_gen.distinctParent.pdgId),
+    NO_PARENT instead of None
+    """
+    ancestry = genpart_ancestry(obj._events().GenPart)
+
+    matched = ak.mask(obj.genPartIdx, obj.genPartIdx >= 0)
+
+    return ak.fill_none(ancestry.distinctParentPdgId[matched], NO_PARENT)
+
+
+def _ancestry_kernel(mother, pdgid, local):
+
+    start = np.arange(len(local)) - local # flat index of the first gen particle of the event
+    parent = np.where(mother >= 0, start + mother, -1)
+
+    distinct = _distinct_parent_loop(parent, pdgid) if numba is not None else _distinct_parent_numpy(parent, pdgid)
+    found = distinct >= 0
+
+    return {
+        "distinctParentIdx": np.where(found, distinct - start, -1).astype(np.int32),
+        "distinctParentPdgId": np.where(found, pdgid[distinct], NO_PARENT).astype(pdgid.dtype),
+    }
+
+
+def _distinct_parent_numpy(parent, pdgid):
+    # walk everyone up at once, one generation per iteration
+    distinct = parent.copy()
+    walking = np.flatnonzero(distinct >= 0)
+    walking = walking[pdgid[distinct[walking]] == pdgid[walking]]
+
+    while len(walking):
+        distinct[walking] = parent[distinct[walking]]
+        walking = walking[distinct[walking] >= 0]
+        walking = walking[pdgid[distinct[walking]] == pdgid[walking]]
+
+    return distinct
+
+
+if numba is not None:
+
+    @numba.njit
+    def _distinct_parent_loop(parent, pdgid):
+        distinct = np.empty(len(parent), dtype=np.int64)
+        for i in range(len(parent)):
+            ancestor = parent[i]
+            while ancestor >= 0 and pdgid[ancestor] == pdgid[i]:
+                ancestor = parent[ancestor]
+            distinct[i] = ancestor
+        return distinct
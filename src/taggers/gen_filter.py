@@ -3,89 +3,264 @@
 # We are concerned with primary electrons, so:
 # Only allows W's, Z's, and sleptons through
 
+import sys
+
 import awkward as ak
 import numpy as np
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from analysis_tools.taggers.flat_kernels import flat_numpy, map_flat, per_partition, unflatten_like
+from analysis_tools.taggers.gen_ancestry import NO_PARENT, genpart_ancestry, matched_parent_pdgid
+
 
 ###########################################################################
 # Gen Parent Filtering here
+#
+# The distinct parent pdgId is resolved once per collection (cached as the 'parentPdgId' field, NO_PARENT
+# where there is no gen match), from the GenPart ancestry table shared by all collections (gen_ancestry.py),
+# and every parent filter is one lookup against a sorted pdgId whitelist.
 
+WZ_PARENTS = sorted([24, -24, 23])
 
-def WZ_mask(obj):
+SUSY_PARENTS = sorted([
+    1000011, 2000011,     # selectrons
+    1000013, 2000013,     # smuons
+    1000022,              # LSP
+    1000023,              # second neutralino
+    1000024, -1000024,    # lightest chargino
+])
+
+PARENT_PDGIDS = sorted(WZ_PARENTS + SUSY_PARENTS) # what parent_mask lets through, edit to change the signal parents
+
+
+def parent_pdgid(obj):
     # obj could be events.Electron, events.LowPtElectron, or events.Muon
 
-    is_W = (abs(obj.matched_gen.distinctParent.pdgId) == 24)
-    is_W_clean = ak.fill_none(is_W, False)
-    
-    is_Z = (obj.matched_gen.distinctParent.pdgId == 23)
-    is_Z_clean = ak.fill_none(is_Z, False)
+    if "parentPdgId" not in obj.fields:
+        obj["parentPdgId"] = matched_parent_pdgid(obj)
 
-    all_filters = (is_W_clean | is_Z_clean)
+    return obj.parentPdgId
 
-    return all_filters #returns a boolean mask
 
+def parent_in(obj, pdgids):
+    """
+    Boolean mask: the distinct parent of the matched gen particle has one of the pdgids
+    """
+    if NO_PARENT in pdgids:
+        sys.exit(f'pdgId {NO_PARENT} is the no-parent sentinel, it cannot be in a parent whitelist')
 
+    return map_flat(_isin_kernel, parent_pdgid(obj), whitelist=tuple(sorted(pdgids)))
 
-def susy_mask(obj):
-    # obj could be events.Electron or events.LowPtElectron
 
-    is_sel = ((obj.matched_gen.distinctParent.pdgId == 1000011) | 
-              (obj.matched_gen.distinctParent.pdgId == 2000011))
-    is_sel_clean = ak.fill_none(is_sel, False)
+def _isin_kernel(pdgid, whitelist):
+    whitelist = np.asarray(whitelist, dtype=pdgid.dtype)
+    if len(whitelist) == 0:
+        return np.zeros(len(pdgid), dtype=bool)
+
+    position = np.searchsorted(whitelist, pdgid).clip(max=len(whitelist) - 1)
+
+    return whitelist[position] == pdgid
+
 
-    is_smu = ((obj.matched_gen.distinctParent.pdgId == 1000013) | 
-              (obj.matched_gen.distinctParent.pdgId == 2000013))
-    is_smu_clean = ak.fill_none(is_smu, False)
+def WZ_mask(obj):
 
-    is_LSP = (obj.matched_gen.distinctParent.pdgId == 1000022)
-    is_LSP_clean = ak.fill_none(is_LSP, False)
+    return parent_in(obj, WZ_PARENTS) #returns a boolean mask
 
-    is_sLSP = (obj.matched_gen.distinctParent.pdgId == 1000023)
-    is_sLSP_clean = ak.fill_none(is_sLSP, False)
 
-    is_LCG = (abs(obj.matched_gen.distinctParent.pdgId) == 1000024)
-    is_LCG_clean = ak.fill_none(is_LCG, False)
 
-    all_filters = (is_sel_clean | is_smu_clean | is_LSP_clean | is_sLSP_clean | is_LCG_clean)
+def susy_mask(obj):
+    # obj could be events.Electron or events.LowPtElectron
 
-    return all_filters #returns a boolean mask
+    return parent_in(obj, SUSY_PARENTS) #returns a boolean mask
 
 
 
 def parent_mask(obj):
     
-    mask = WZ_mask(obj) | susy_mask(obj)
+    mask = parent_in(obj, PARENT_PDGIDS)
 
     return mask
 
 
 
+def prompt_gen_mask(genpart, abs_pdgids=(11, 13)):
+    """
+    Boolean mask on GenPart itself (no reco object): final state (status 1) particles with one of the |pdgId|
+    whose distinct parent passes parent_mask, i.e. the prompt signal leptons
+    """
+    ancestry = genpart_ancestry(genpart)
+
+    return map_flat(
+        _prompt_kernel, genpart.pdgId, genpart.status, ancestry.distinctParentPdgId,
+        abs_pdgids=tuple(abs_pdgids), whitelist=tuple(PARENT_PDGIDS),
+    )
+
+
+def _prompt_kernel(pdgid, status, parent_pdgid, abs_pdgids, whitelist):
+
+    return np.isin(np.abs(pdgid), abs_pdgids) & (status == 1) & _isin_kernel(parent_pdgid, whitelist)
+
+
+
 ###########################################################################
 # Gen kinematic masks here
 
+GEN_PT_MIN = {"ele": 4.5, "lpte": 0.5, "muon": 2.5} # gen pt threshold of each collection's gen mask
+GEN_ABS_ETA_MAX = 3
+
 
-def ele_gen_mask(ele_obj):
+def ele_gen_mask(ele_obj, matched=None):
+    # matched: the matched GenPart per electron if not matched_gen, e.g. dr_matched_gen(...)
+
+    matched = ele_obj.matched_gen if matched is None else matched
     
-    mask = ((ele_obj.matched_gen.pt > 4.5) & (np.abs(ele_obj.matched_gen.eta) < 3))
+    mask = ((matched.pt > GEN_PT_MIN["ele"]) & (np.abs(matched.eta) < GEN_ABS_ETA_MAX))
     mask_clean = ak.fill_none(mask, False)
     
     return mask_clean
 
     
 
-def muon_gen_mask(muon_obj):
+def muon_gen_mask(muon_obj, matched=None):
+
+    matched = muon_obj.matched_gen if matched is None else matched
     
-    mask = ((muon_obj.matched_gen.pt > 2.5) & (np.abs(muon_obj.matched_gen.eta) < 3))
+    mask = ((matched.pt > GEN_PT_MIN["muon"]) & (np.abs(matched.eta) < GEN_ABS_ETA_MAX))
     mask_clean = ak.fill_none(mask, False)
     
     return mask_clean
 
     
 
-def lpte_gen_mask(lpte_obj):
+def lpte_gen_mask(lpte_obj, matched=None):
 
-    mask = ((lpte_obj.matched_gen.pt > 0.5) & (np.abs(lpte_obj.matched_gen.eta) < 3))
+    matched = lpte_obj.matched_gen if matched is None else matched
+
+    mask = ((matched.pt > GEN_PT_MIN["lpte"]) & (np.abs(matched.eta) < GEN_ABS_ETA_MAX))
     mask_clean = ak.fill_none(mask, False)
     
     return mask_clean
-    
+
+
+
+###########################################################################
+# Delta-R truth matching, for collections whose genPartIdx is missing or poor (LowPtElectron in some NanoAOD versions)
+#
+# Per event the gen candidates are sorted by eta once, and every reco object only looks at the candidates inside
+# its eta window [eta - max_dr, eta + max_dr] (two binary searches), so there is no reco x gen cartesian product.
+
+
+def dr_match(obj, genpart, max_dr=0.1, abs_pdgid=None):
+    """
+    Index (in the event's GenPart, like genPartIdx) of the closest gen particle within max_dr of each object,
+    -1 if there is none. abs_pdgid (e.g. 11) only considers gen particles with that |pdgId|.
+    """
+    return _dr_match_columns(obj.eta, obj.phi, genpart.eta, genpart.phi, genpart.pdgId, max_dr=max_dr, abs_pdgid=abs_pdgid)
+
+
+def dr_matched_gen(obj, genpart, max_dr=0.1, abs_pdgid=None):
+    """
+    The gen particle dr_match found for each object (None where there is none), usable like obj.matched_gen
+    """
+    index = dr_match(obj, genpart, max_dr, abs_pdgid)
+
+    return genpart[ak.mask(index, index >= 0)]
+
+
+@per_partition(label="dr-match")
+def _dr_match_columns(obj_eta, obj_phi, gen_eta, gen_phi, gen_pdgid, max_dr, abs_pdgid):
+
+    obj_offsets = np.concatenate([[0], np.cumsum(ak.to_numpy(ak.num(obj_eta, axis=1)))])
+    gen_offsets = np.concatenate([[0], np.cumsum(ak.to_numpy(ak.num(gen_eta, axis=1)))])
+
+    pdgid = flat_numpy(gen_pdgid)
+    candidate = np.ones(len(pdgid), dtype=bool) if abs_pdgid is None else (np.abs(pdgid) == abs_pdgid)
+
+    matched = _dr_match_loop(
+        obj_offsets, flat_numpy(obj_eta), flat_numpy(obj_phi),
+        gen_offsets, flat_numpy(gen_eta), flat_numpy(gen_phi), candidate,
+        float(max_dr),
+    )
+
+    return unflatten_like(matched, obj_eta)
+
+
+def _dr_match_loop(obj_offsets, obj_eta, obj_phi, gen_offsets, gen_eta, gen_phi, candidate, max_dr):
+
+    matched = np.full(len(obj_eta), -1, dtype=np.int32)
+    max_dr2 = max_dr * max_dr
+
+    for event in range(len(obj_offsets) - 1):
+        first_gen = gen_offsets[event]
+        local = np.flatnonzero(candidate[first_gen:gen_offsets[event + 1]])
+        if len(local) == 0:
+            continue
+
+        order = local[np.argsort(gen_eta[first_gen + local], kind="mergesort")]
+        sorted_eta = gen_eta[first_gen + order]
+
+        for i in range(obj_offsets[event], obj_offsets[event + 1]):
+            low = np.searchsorted(sorted_eta, obj_eta[i] - max_dr, side="left")
+            high = np.searchsorted(sorted_eta, obj_eta[i] + max_dr, side="right")
+
+            best = max_dr2
+            for k in range(low, high):
+                j = first_gen + order[k]
+                deta = np.float64(obj_eta[i]) - gen_eta[j]
+                dphi = (np.float64(obj_phi[i]) - gen_phi[j] + np.pi) % (2 * np.pi) - np.pi
+                dr2 = deta * deta + dphi * dphi
+                if dr2 < best:
+                    best = dr2
+                    matched[i] = order[k]
+
+    return matched
+
+
+if numba is not None:
+    _dr_match_loop = numba.njit(_dr_match_loop) # the plain python loop above is the (slow) fallback
+
+
+
+###########################################################################
+# Reco quality of every gen particle, the inverse of matched_gen
+#
+# Each reco object's genPartIdx is scattered into a per-GenPart array (np.maximum.at over the flat gen index),
+# so every gen particle knows the best qual_tag among the reco objects pointing at it. One pass per collection,
+# no gen x reco product, which is what the gen-side efficiency denominators need on large signal grids.
+
+NO_RECO_MATCH = -2 # below every qual_tag (quality.QUAL_TAGS), gen particles no reco object points at
+
+
+def matched_reco_quality(genpart, *tagged):
+    """
+    int8 per gen particle: the highest qual_tag of the tagged reco collections (tag_ele, tag_muon, ... output, any
+    selection) whose genPartIdx points at it, NO_RECO_MATCH if none does. A dr_match index can stand in for
+    genPartIdx by setting it as that field first.
+    """
+    columns = [genpart.pdgId]
+    for obj in tagged:
+        columns += [obj.genPartIdx, obj.qual_tag]
+
+    return _reco_quality_columns(*columns)
+
+
+@per_partition(label="matched-reco-quality")
+def _reco_quality_columns(gen_pdgid, *reco_columns):
+
+    gen_counts = ak.to_numpy(ak.num(gen_pdgid, axis=1))
+    gen_starts = np.cumsum(gen_counts) - gen_counts
+
+    quality = np.full(gen_counts.sum(), NO_RECO_MATCH, dtype=np.int8)
+
+    for gen_idx, qual_tag in zip(reco_columns[::2], reco_columns[1::2]):
+        starts = np.repeat(gen_starts, ak.to_numpy(ak.num(gen_idx, axis=1)))
+        gen_idx, qual_tag = flat_numpy(gen_idx), flat_numpy(qual_tag)
+
+        matched = gen_idx >= 0
+        np.maximum.at(quality, starts[matched] + gen_idx[matched], qual_tag[matched].astype(np.int8))
+
+    return unflatten_like(quality, gen_pdgid)
@@ -1,68 +1,107 @@
+import copy
 import json
 
 from analysis_tools.taggers.gen_filter import *
+from analysis_tools.taggers.columns import declare_columns
+from analysis_tools.taggers.flat_kernels import flat_numpy, is_dask, lazy_like, map_flat
 
 
-def tag_gen(obj, obj_name): 
+GEN_TAGS = {"other": -10, "signal": 10, "light_fake": 11, "heavy_decay": 12, "tau_decay": 13}
+
+# gen_tag of every genPartFlav code, signal (genPartFlav 1 with a signal parent and gen kinematics) is applied on top
+GEN_TAG_LUT = np.full(256, GEN_TAGS["other"], dtype=np.int8)
+GEN_TAG_LUT[0] = GEN_TAGS["light_fake"]
+GEN_TAG_LUT[[4, 5]] = GEN_TAGS["heavy_decay"]
+GEN_TAG_LUT[15] = GEN_TAGS["tau_decay"]
+
+
+def tag_gen(obj, obj_name, is_mc=None, lazy=True): 
 
     """Adds a new field to objs (Electron, LowPtElectron, or Muon collections) named 'gen_tag', can access it like Electron.gen_tag (after you run this function and reassign the electron collection to this one thats returned). 
 
-    The resulting integers correspond like this:
+    The resulting integers (int8) correspond like this:
+
+    obj.gen_tag == 10, SIGNAL (prompt, from a W/Z/SUSY parent, inside the gen acceptance)
+    obj.gen_tag == 11, UNMATCHED TO PV (light fake)
+    obj.gen_tag == 12, DECAY FROM B OR C
+    obj.gen_tag == 13, DECAY FROM TAU
+    obj.gen_tag == -10, OTHER (any other genflav than the above)
 
-    obj.gen_tag == 0, SIGNAL
-    obj.gen_tag == 1, UNMATCHED TO PV
-    obj.gen_tag == 2, DECAY FROM B OR C
-    obj.gen_tag == 3, DECAY FROM TAU
-    obj.gen_tag == 999, OTHER DECAY (any other genflav than the above)
+    is_mc=None takes it from the fileset metadata of the chunk ('is_mc', MC when missing). On data gen_tag is
+    all OTHER and no gen branch is read. With lazy=True (eager/virtual collections) the tagging only runs when
+    gen_tag is first read, so a chunk whose histograms never look at gen_tag never loads the gen branches.
+    lazy has no effect on dask collections: the flat kernels touch all their inputs, so the GenPart columns and
+    genPartFlav/genPartIdx are read even when nothing reads gen_tag. Pass is_mc=False to skip them there.
     
     """
 
+    if is_mc is None:
+        is_mc = sample_is_mc(obj)
+
+    if is_dask(obj) or ak.backend(obj) == "typetracer":
+        # a graph: map_flat touches every input of the kernels, the gen columns stay in it even if gen_tag is unused
+        obj["gen_tag"] = gen_tag(obj, obj_name) if is_mc else ak.full_like(obj.pt, GEN_TAGS["other"], dtype=np.int8)
+    elif not is_mc:
+        obj["gen_tag"] = lazy_like(obj, np.int8, lambda n: np.full(n, GEN_TAGS["other"], dtype=np.int8))
+    elif lazy:
+        # tagging adds helper fields (parentPdgId) to the collection it reads: give it a copy, so the caller's
+        # collection does not change when gen_tag is read later
+        source = copy.copy(obj)
+        obj["gen_tag"] = lazy_like(obj, np.int8, lambda n: flat_numpy(gen_tag(source, obj_name)))
+    else:
+        obj["gen_tag"] = gen_tag(obj, obj_name)
+
+    return obj
+
+
+def gen_tag(obj, obj_name):
+    """
+    The gen_tag column of tag_gen (computed now, the collection is not modified)
+    """
     if obj_name.lower() in ["ele", "electron"]:
 
-        signal_mask = (
-            (obj.genPartFlav == 1) 
-            & parent_mask(obj)
-            & ele_gen_mask(obj)
-        )
+        signal_mask = parent_mask(obj) & ele_gen_mask(obj)
         
     elif obj_name.lower() in ["lpte", "lowptelectron"]:
         
-        signal_mask = (
-            (obj.genPartFlav == 1) 
-            & parent_mask(obj)
-            & lpte_gen_mask(obj)
-        )
+        signal_mask = parent_mask(obj) & lpte_gen_mask(obj)
         
     elif obj_name.lower() in ["mu", "muon"]:
         
-        signal_mask = (
-            (obj.genPartFlav == 1) 
-            & parent_mask(obj)
-            & muon_gen_mask(obj)
-        )
+        signal_mask = parent_mask(obj) & muon_gen_mask(obj)
         
     else:
         sys.exit(f"invalid obj_name: {obj_name}")
-        
-    light_fake_mask = (obj.genPartFlav == 0)
-    heavy_decay_mask = ( (obj.genPartFlav == 4) | (obj.genPartFlav == 5) )
-    tau_decay_mask = (obj.genPartFlav == 15)
-    
 
-    
-    obj["gen_tag"] = -10 # Filling everything with dummy values for now
-    obj["gen_tag"] = ak.where(signal_mask, 10, obj.gen_tag)
-    obj["gen_tag"] = ak.where(light_fake_mask, 11, obj.gen_tag)
-    obj["gen_tag"] = ak.where(heavy_decay_mask, 12, obj.gen_tag)
-    obj["gen_tag"] = ak.where(tau_decay_mask, 13, obj.gen_tag)
-
-#    obj["gen_tag"] = 'other_gen' # Filling everything with dummy values for now
-#    obj["gen_tag"] = ak.where(signal_mask, 'signal', obj.gen_tag)
-#    obj["gen_tag"] = ak.where(light_fake_mask, 'light_fake', obj.gen_tag)
-#    obj["gen_tag"] = ak.where(heavy_decay_mask, 'heavy_decay', obj.gen_tag)
-#    obj["gen_tag"] = ak.where(tau_decay_mask, 'tau_decay', obj.gen_tag)
-    
-    return obj
+    # one pass over the flat genPartFlav: table lookup, signal on top
+    return map_flat(_gen_tag_kernel, obj.genPartFlav, signal_mask)
+
+
+def sample_is_mc(obj):
+    """
+    'is_mc' of the fileset metadata the collection was read with (events.metadata), True when not given
+    """
+    return bool(obj._events().metadata.get("is_mc", True))
+
+
+def _gen_tag_kernel(gen_part_flav, signal_mask):
 
+    gen_tag = GEN_TAG_LUT[gen_part_flav.astype(np.uint8)]
+    gen_tag[(gen_part_flav == 1) & signal_mask] = GEN_TAGS["signal"]
 
+    return gen_tag
 
+
+
+# columns tag_gen reads: genPartFlav/genPartIdx on the tagged collection, the rest through matched_gen.distinctParent
+GEN_TAG_COLUMNS = ["genPartFlav", "genPartIdx"]
+GENPART_COLUMNS = ["pdgId", "genPartIdxMother", "pt", "eta"]
+
+declare_columns(tag_gen, GenPart=GENPART_COLUMNS)
+
+
+def tag_gen_columns(collection):
+    """
+    Columns tag_gen reads when tagging this collection ("Electron", "LowPtElectron" or "Muon")
+    """
+    return {collection: GEN_TAG_COLUMNS, "GenPart": GENPART_COLUMNS}
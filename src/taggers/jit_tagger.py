@@ -0,0 +1,130 @@
+# Numba backend for the spec taggers: the whole selection of a collection in one loop over the flat columns
+#
+# The steps of a compiled spec (spec_tagger.compile_spec) become the body of a single jitted loop that reads
+# each object's columns once, evaluates the derived variables and cuts as scalars and writes qual_tag and the
+# packed qual_flags directly: no temporary array per cut. The results are bit-identical to the numpy/numexpr
+# path of spec_tagger.py, which is what runs when numba is not installed.
+
+import ast
+from functools import lru_cache
+
+import numpy as np
+
+from .quality import QUAL_TAGS, IS_BASELINE, IS_BRONZE, IS_SILVER, IS_GOLD
+from .vid_unpacked import VID_CUTS
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def jit_quality_kernel(spec, flat_columns, float_dtype, sip3d_cut, packed=False, params=None):
+    """
+    Flat quality columns (dict, like quality.quality_kernel) of one compiled spec, computed by the jitted loop.
+    params are the values of the spec params (all of them)
+    """
+    loop, literals = _compile_loop(spec)
+
+    params = params or spec.params
+    constants = np.array(list(spec.constants.values()) + [params[name] for name in spec.params] + literals, dtype=float_dtype)
+    qual_tag, qual_flags = loop(*flat_columns, constants, float_dtype.type(sip3d_cut))
+
+    if packed:
+        return {"qual_flags": qual_flags}
+
+    return {
+        "isBaseline": (qual_flags & IS_BASELINE) != 0,
+        "isGold":     (qual_flags & IS_GOLD) != 0,
+        "isSilver":   (qual_flags & IS_SILVER) != 0,
+        "isBronze":   (qual_flags & IS_BRONZE) != 0,
+        "qual_tag":   qual_tag,
+    }
+
+
+@lru_cache(maxsize=None)
+def _compile_loop(spec):
+
+    literals = []
+    names = list(spec.constants) + list(spec.params)
+    rewrite = _ScalarExpression(names, literals)
+
+    body = []
+    for column in spec.columns:
+        if column == "vidNestedWPBitmap":
+            body.append("_bitmap = np.uint32(_col_vidNestedWPBitmap[_i])")
+        else:
+            body.append(f"{column} = _col_{column}[_i]")
+
+    for name, (level, excluded) in spec.vid.items():
+        fields = [f"(((_bitmap >> {3 * i}) & 7) >= {level})" for i, cut in enumerate(VID_CUTS) if cut not in excluded]
+        body.append(f"{name} = {' & '.join(fields)}")
+
+    for target, expression, _ in spec.steps:
+        tree = rewrite.visit(ast.parse(expression, mode="eval"))
+        body.append(f"{target} = {ast.unparse(ast.fix_missing_locations(tree))}")
+
+    constants = [f"{name} = _constants[{i}]" for i, name in enumerate(names)]
+
+    source = "\n".join([
+        f"def _quality_loop({', '.join(f'_col_{column}' for column in spec.columns)}, _constants, _sip3d_cut):",
+        *(f"    {line}" for line in constants),
+        f"    _n = len(_col_{spec.columns[0]})",
+        f"    _qual_tag = np.full(_n, {QUAL_TAGS['fail']}, dtype=np.int8)",
+        "    _qual_flags = np.zeros(_n, dtype=np.uint8)",
+        "    for _i in range(_n):",
+        *(f"        {line}" for line in body),
+        "        if not baseline:",
+        "            continue",
+        "        if not gold_silver:",
+        f"            _qual_tag[_i] = {QUAL_TAGS['bronze']}",
+        f"            _qual_flags[_i] = {IS_BASELINE | IS_BRONZE}",
+        f"        elif {spec.sip3d} < _sip3d_cut:",
+        f"            _qual_tag[_i] = {QUAL_TAGS['gold']}",
+        f"            _qual_flags[_i] = {IS_BASELINE | IS_GOLD}",
+        f"        elif {spec.sip3d} >= _sip3d_cut:",
+        f"            _qual_tag[_i] = {QUAL_TAGS['silver']}",
+        f"            _qual_flags[_i] = {IS_BASELINE | IS_SILVER}",
+        "        else:", # undefined sip3d (NaN), stays plain baseline
+        f"            _qual_tag[_i] = {QUAL_TAGS['baseline']}",
+        f"            _qual_flags[_i] = {IS_BASELINE}",
+        "    return _qual_tag, _qual_flags",
+    ])
+
+    namespace = {"np": np}
+    exec(compile(source, f"<quality loop {id(spec)}>", "exec"), namespace)
+
+    # error_model="numpy": x/0 gives inf/nan like the array code instead of raising
+    return numba.njit(error_model="numpy")(namespace["_quality_loop"]), literals
+
+
+class _ScalarExpression(ast.NodeTransformer):
+
+    # scalar numba math has to stay in the column float dtype like numpy does with python numbers:
+    # int literals become constants of that dtype (300/pt is float32 / float32), x**2 becomes x*x
+    # (what numpy and numexpr compute for a square), sqrt the float32-preserving np.sqrt
+
+    def __init__(self, names, literals):
+        self.names = names
+        self.literals = literals
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, int):
+            return node
+
+        name = f"_int_const{len(self.literals)}"
+        self.names.append(name)
+        self.literals.append(node.value)
+        return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+
+    def visit_BinOp(self, node):
+        if isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant) and node.right.value == 2:
+            base = self.visit(node.left)
+            return ast.copy_location(ast.BinOp(left=base, op=ast.Mult(), right=base), node)
+        return self.generic_visit(node)
+
+    def visit_Call(self, node):
+        node = self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id == "sqrt":
+            node.func = ast.Attribute(value=ast.Name(id="np", ctx=ast.Load()), attr="sqrt", ctx=ast.Load())
+        return node
@@ -0,0 +1,146 @@
+# Lepton quality selections written as data, one entry per era
+#
+# Every collection spec has:
+#   "vid":         cutBasedID working points computed from vidNestedWPBitmap, name: (level, excluded cuts)
+#   "cached":      helper variables stored on the collection as fields the first time, and read back afterwards
+#   "derived":     helper variables, evaluated in order (later ones can use earlier ones)
+#   "baseline":    the baseline selection
+#   "gold_silver": what a baseline lepton needs on top to be gold or silver (the rest is bronze)
+#   "sip3d":       variable that splits gold (< global_sip3d) from silver (>=)
+#   "sip3d_squared": True when that variable is the squared SIP3D (the cut gets squared instead of taking a sqrt)
+#   "params":      named cut values used in the expressions, can be overridden per call or scanned
+#                  (tag_quality_from_spec(params=...), scan_quality_from_spec)
+#
+# Expressions use the NanoAOD branch names of the collection, &, |, comparisons, arithmetic, abs() and sqrt().
+# They are compiled by spec_tagger.py. A new era is a new entry here, e.g. LEP_SPECS["Run3"] = {...}
+
+_PARAMS = {
+    "iso_cut": 4, # absolute iso03pt / miniIsoPt cut of gold and silver
+}
+
+_ISO_DERIVED = {
+    "abs_eta":   "abs(eta)",
+    "iso03pt":   "pfRelIso03_all * pt",
+    "miniIsoPt": "miniPFRelIso_all * pt",
+    "iso_max":   "20 + 300/pt",
+}
+
+_LPTE_CACHED = {
+    "sip3d2":    "(dxy/dxyErr)**2 + (dz/dzErr)**2", # squared SIP3D, approximation or rough calculation based on what Suyash did years ago
+}
+
+_LPTE_DERIVED = {
+    "abs_eta":   "abs(eta)",
+    "miniIsoPt": "miniPFRelIso_all * pt",
+    "iso_max":   "20 + 300/pt",
+}
+
+_MUON_SPEC = {
+    "derived": _ISO_DERIVED,
+    "baseline": """
+        (abs_eta < 2.5)
+        & (sip3d < 6)
+        & (abs(dxy) < 0.05)
+        & (abs(dz)  < 0.1)
+        & (iso03pt   < iso_max)
+        & (miniIsoPt < iso_max)
+    """,
+    "gold_silver": """
+        (iso03pt   <= iso_cut)
+        & (miniIsoPt <= iso_cut)
+        & tightId
+    """,
+    "sip3d": "sip3d",
+    "params": _PARAMS,
+}
+
+_ELE_VID = {
+    "vid_loose": ("loose", ("iso", "hoe")),
+    "vid_tight": ("tight", ("iso", "hoe")),
+}
+
+_ELE_BASELINE = """
+    (pt >= 7)
+    & ( ((pt >= 10) & (abs_eta < 2.5)) | ((pt < 10) & (abs_eta < 1.442)) )
+    & (sip3d < 6)
+    & (abs(dxy) < 0.05)
+    & (abs(dz)  < 0.1)
+    & (iso03pt   < iso_max)
+    & (miniIsoPt < iso_max)
+    & (lostHits == 0)
+    & convVeto
+    & vid_loose
+"""
+
+_ELE_LOW_PT_PASS = """
+    ( (pt < 20) & (iso03pt <= iso_cut) & (miniIsoPt <= iso_cut) & vid_tight )
+"""
+
+_LPTE_BASELINE = """
+    (pt >= 2) & (pt < 7)
+    & (abs_eta < 1.442)
+    & (sip3d2 < 36)
+    & (abs(dxy) < 0.05)
+    & (abs(dz)  < 0.1)
+    & (miniIsoPt < iso_max)
+    & convVeto
+    & (lostHits == 0)
+"""
+
+
+LEP_SPECS = {
+
+    "preUL": {
+        "ele": {
+            "vid": _ELE_VID,
+            "derived": _ISO_DERIVED,
+            "baseline": _ELE_BASELINE,
+            "gold_silver": _ELE_LOW_PT_PASS + "| ( (pt >= 20) & mvaIso_WP90 )",
+            "sip3d": "sip3d",
+            "params": _PARAMS,
+        },
+        "lpte": {
+            "cached": _LPTE_CACHED,
+            "derived": _LPTE_DERIVED,
+            "baseline": _LPTE_BASELINE + "& (ID >= 1.5)",
+            "gold_silver": """
+                (miniIsoPt <= iso_cut)
+                & ( ((abs_eta >= 0.8) & (abs_eta < 1.442) & (ID >= 3))
+                  | ((abs_eta < 0.8) & (ID >= 2.3)) )
+            """,
+            "sip3d": "sip3d2",
+            "sip3d_squared": True,
+            "params": _PARAMS,
+        },
+        "muon": _MUON_SPEC,
+    },
+
+    "UL": {
+        "ele": {
+            "vid": _ELE_VID,
+            "derived": _ISO_DERIVED,
+            "baseline": _ELE_BASELINE,
+            "gold_silver": _ELE_LOW_PT_PASS + "| ( (pt >= 20) & mvaFall17V2Iso_WP90 )", # unsure which mva performs best for UL
+            "sip3d": "sip3d",
+            "params": _PARAMS,
+        },
+        "lpte": {
+            "cached": _LPTE_CACHED,
+            "derived": _LPTE_DERIVED,
+            "baseline": _LPTE_BASELINE + "& (ID >= 2)",
+            "gold_silver": """
+                (miniIsoPt <= iso_cut)
+                & ( ( (pt < 4)
+                      & ( ((abs_eta >= 0.8) & (abs_eta < 1.442) & (ID >= 3))
+                        | ((abs_eta < 0.8) & (ID >= 2.6)) ) )
+                  | ( (pt >= 4)
+                      & ( ((abs_eta >= 0.8) & (abs_eta < 1.442) & (ID >= 3.2))
+                        | ((abs_eta < 0.8) & (ID >= 2.8)) ) ) )
+            """,
+            "sip3d": "sip3d2",
+            "sip3d_squared": True,
+            "params": _PARAMS,
+        },
+        "muon": _MUON_SPEC,
+    },
+}
@@ -0,0 +1,102 @@
+# One lepton table for Electron, Muon and (optionally) LowPtElectron, tagged in one call
+#
+# Concatenating the tagged collections (ak.concatenate of records with different fields) gives union layouts
+# that are slow to index. lepton_table instead fills a fixed structure-of-arrays schema: every column is
+# allocated once per chunk with the total number of leptons, each collection is scattered into its slots,
+# and the result is a plain jagged record array (PtEtaPhiMCandidate, so delta_r, + etc. work).
+#
+# source says which collection a lepton comes from (SOURCES), source_idx is its index in that collection.
+
+import awkward as ak
+import numpy as np
+from coffea.nanoevents.methods import candidate
+
+from .flat_kernels import flat_numpy, per_partition
+from .gen_tagger import GEN_TAGS, gen_tag, sample_is_mc
+from .spec_tagger import quality_from_spec
+
+
+LEPTON_SCHEMA = {
+    "pt":         np.float32,
+    "eta":        np.float32,
+    "phi":        np.float32,
+    "mass":       np.float32,
+    "charge":     np.int32,
+    "flavour":    np.int8,  # 11 or 13
+    "gen_tag":    np.int8,  # see gen_tagger.tag_gen, NO_GEN_TAG when not tagged (data)
+    "qual_tag":   np.int8,  # see quality.py
+    "source":     np.int8,  # SOURCES
+    "source_idx": np.int32, # index in the source collection (after the pt split)
+}
+
+SOURCES = {"Electron": 0, "Muon": 1, "LowPtElectron": 2}
+FLAVOURS = {"Electron": 11, "Muon": 13, "LowPtElectron": 11}
+COLLECTION_IDS = {"Electron": "ele", "Muon": "muon", "LowPtElectron": "lpte"}
+
+NO_GEN_TAG = GEN_TAGS["other"] # the dummy value of tag_gen
+
+_KINEMATICS = ["pt", "eta", "phi", "mass", "charge"]
+
+
+def lepton_table(electron, muon, lowptelectron=None, era="preUL", sip3d_cut=3, jit=False, gen=None, lpte_pt_split=7):
+    """
+    Tag the lepton collections and return them as one jagged table with the LEPTON_SCHEMA fields,
+    electrons then muons then low pt electrons in every event.
+
+    With lowptelectron, electrons below lpte_pt_split are replaced by the low pt electrons below it,
+    like tag_and_combine_ele. gen=False skips the gen tagging (data), gen_tag is NO_GEN_TAG then.
+    gen=None takes it from 'is_mc' of the fileset metadata (gen_tagger.sample_is_mc).
+    """
+    if gen is None:
+        gen = sample_is_mc(electron)
+
+    collections = {"Electron": electron, "Muon": muon}
+    if lowptelectron is not None:
+        collections["Electron"] = electron[electron.pt >= lpte_pt_split]
+        collections["LowPtElectron"] = lowptelectron[lowptelectron.pt < lpte_pt_split]
+
+    columns = []
+    for name, obj in collections.items():
+        quality = quality_from_spec(obj, era, COLLECTION_IDS[name], sip3d_cut=sip3d_cut, jit=jit)
+        columns += [obj[field] for field in _KINEMATICS] + [quality.qual_tag]
+        if gen:
+            columns.append(gen_tag(obj, COLLECTION_IDS[name]))
+
+    return _fill_table(*columns, sources=tuple(collections), gen=gen)
+
+
+@per_partition(label="lepton-table")
+def _fill_table(*columns, sources, gen):
+
+    per_source = len(_KINEMATICS) + 1 + gen
+    fields = _KINEMATICS + ["qual_tag"] + (["gen_tag"] if gen else [])
+    parts = [dict(zip(fields, columns[i:i + per_source])) for i in range(0, len(columns), per_source)]
+
+    counts = [ak.to_numpy(ak.num(part["pt"], axis=1)) for part in parts]
+    total = np.sum(counts, axis=0)
+    offsets = np.zeros(len(total) + 1, dtype=np.int64)
+    np.cumsum(total, out=offsets[1:])
+
+    table = {field: np.empty(offsets[-1], dtype=dtype) for field, dtype in LEPTON_SCHEMA.items()} # once per chunk
+
+    before = offsets[:-1].copy() # where the next source starts in every event
+    for name, part, count in zip(sources, parts, counts):
+        starts = np.repeat(before, count)
+        local = np.arange(len(starts)) - np.repeat(np.cumsum(count) - count, count)
+        slots = starts + local
+
+        for field in fields:
+            table[field][slots] = flat_numpy(part[field])
+        if not gen:
+            table["gen_tag"][slots] = NO_GEN_TAG
+
+        table["flavour"][slots] = FLAVOURS[name]
+        table["source"][slots] = SOURCES[name]
+        table["source_idx"][slots] = local
+
+        before += count
+
+    return ak.unflatten(
+        ak.zip(table, with_name="PtEtaPhiMCandidate", behavior=candidate.behavior),
+        total,
+    )
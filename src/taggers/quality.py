@@ -0,0 +1,190 @@
+# Encoding of the lepton quality categories (shared by lep_tagger and lep_tagger_UL)
+#
+# qual_tag == -1,  FAILS BASELINE
+# qual_tag == 0,   BASELINE (only when the sip3d split is undefined, e.g. NaN sip3d)
+# qual_tag == 1,   BRONZE
+# qual_tag == 10,  SILVER
+# qual_tag == 100, GOLD
+
+import awkward as ak
+import numpy as np
+from coffea.nanoevents.methods import candidate, nanoaod
+
+
+QUAL_TAGS = {"fail": -1, "baseline": 0, "bronze": 1, "silver": 10, "gold": 100}
+
+# bits of the packed 'qual_flags' field
+IS_BASELINE = 0b0001
+IS_BRONZE   = 0b0010
+IS_SILVER   = 0b0100
+IS_GOLD     = 0b1000
+
+
+def quality_kernel(baseline, bronze, silver, gold, packed=False):
+    """
+    Flat quality columns (dict) from flat masks, what attach_quality expects after map_flat
+    """
+    if packed:
+        return {"qual_flags": _qual_flags_kernel(baseline, bronze, silver, gold)}
+
+    return {
+        "isBaseline": baseline,
+        "isGold":     gold,
+        "isSilver":   silver,
+        "isBronze":   bronze,
+        "qual_tag":   _qual_tag_kernel(baseline, bronze, silver, gold), # int8, -1 fail / 0 baseline / 1 bronze / 10 silver / 100 gold
+    }
+
+
+def unpack_quality_kernel(qual_flags):
+    """
+    The unpacked quality columns (dict, like quality_kernel) from flat packed qual_flags
+    """
+    baseline, bronze, silver, gold = [(qual_flags & bit) != 0 for bit in (IS_BASELINE, IS_BRONZE, IS_SILVER, IS_GOLD)]
+
+    return quality_kernel(baseline, bronze, silver, gold)
+
+
+def attach_quality(obj, quality, packed=False):
+    """
+    Copy the fields of a quality record (map_flat of quality_kernel) onto the collection
+
+    packed=False: 'isBaseline', 'isGold', 'isSilver', 'isBronze' boolean fields plus the int8 'qual_tag'
+    packed=True:  a single uint8 'qual_flags' bitfield (IS_* bits); isBaseline, ..., qual_tag are then
+                  behavior properties computed from it when read. Reassign the collection, e.g. ele = tag_ele(ele, packed=True)
+    """
+    for name in quality.fields:
+        obj[name] = quality[name]
+
+    if packed:
+        return with_quality_behavior(obj)
+    return obj
+
+
+def _qual_tag_kernel(baseline, bronze, silver, gold):
+    # first match wins, so the best category goes first
+    return np.select(
+        [gold, silver, bronze, baseline],
+        [np.int8(QUAL_TAGS["gold"]), np.int8(QUAL_TAGS["silver"]), np.int8(QUAL_TAGS["bronze"]), np.int8(QUAL_TAGS["baseline"])],
+        default=np.int8(QUAL_TAGS["fail"]),
+    )
+
+
+def _qual_flags_kernel(baseline, bronze, silver, gold):
+    return (
+        baseline * np.uint8(IS_BASELINE)
+        | bronze * np.uint8(IS_BRONZE)
+        | silver * np.uint8(IS_SILVER)
+        | gold * np.uint8(IS_GOLD)
+    ).astype(np.uint8)
+
+
+###########################################################################
+# Behavior for packed collections: the old boolean fields as properties
+#
+# The flag properties are added to coffea's own Electron, LowPtElectron, Muon and PtEtaPhiMCandidate classes
+# (same record names, so kinematics, delta_r, p + p and matched_gen are unchanged). PtEtaPhiMCandidate is what
+# concatenated leptons are named (concatenate_leptons, or ak.with_name(ak.concatenate(...), "PtEtaPhiMCandidate")),
+# so the flags survive the concatenation. Only collections with a 'qual_flags' field get this behavior.
+
+class QualityFlags:
+
+    @property
+    def isBaseline(self):
+        return (self.qual_flags & IS_BASELINE) != 0
+
+    @property
+    def isBronze(self):
+        return (self.qual_flags & IS_BRONZE) != 0
+
+    @property
+    def isSilver(self):
+        return (self.qual_flags & IS_SILVER) != 0
+
+    @property
+    def isGold(self):
+        return (self.qual_flags & IS_GOLD) != 0
+
+    @property
+    def qual_tag(self):
+        # bronze, silver and gold never overlap and always come with baseline, so the tag is a plain sum
+        return (
+            np.int8(QUAL_TAGS["fail"])
+            + self.isBaseline
+            + self.isBronze
+            + np.int8(QUAL_TAGS["silver"]) * self.isSilver
+            + np.int8(QUAL_TAGS["gold"]) * self.isGold
+        )
+
+
+class TaggedElectronArray(QualityFlags, nanoaod.ElectronArray):
+    pass
+
+
+class TaggedElectronRecord(QualityFlags, nanoaod.ElectronRecord):
+    pass
+
+
+class TaggedLowPtElectronArray(QualityFlags, nanoaod.LowPtElectronArray):
+    pass
+
+
+class TaggedLowPtElectronRecord(QualityFlags, nanoaod.LowPtElectronRecord):
+    pass
+
+
+class TaggedMuonArray(QualityFlags, nanoaod.MuonArray):
+    pass
+
+
+class TaggedMuonRecord(QualityFlags, nanoaod.MuonRecord):
+    pass
+
+
+class TaggedCandidateArray(QualityFlags, candidate.PtEtaPhiMCandidateArray):
+    pass
+
+
+class TaggedCandidateRecord(QualityFlags, candidate.PtEtaPhiMCandidateRecord):
+    pass
+
+
+TAGGED_CLASSES = {
+    "Electron":           (TaggedElectronRecord, TaggedElectronArray),
+    "LowPtElectron":      (TaggedLowPtElectronRecord, TaggedLowPtElectronArray),
+    "Muon":               (TaggedMuonRecord, TaggedMuonArray),
+    "PtEtaPhiMCandidate": (TaggedCandidateRecord, TaggedCandidateArray),
+}
+
+behavior = {}
+behavior.update(nanoaod.behavior)
+behavior.update({name: record for name, (record, _) in TAGGED_CLASSES.items()})
+behavior.update({("*", name): array for name, (_, array) in TAGGED_CLASSES.items()})
+
+
+@ak.mixin_class(behavior)
+class TaggedLepton(QualityFlags): # any other collection with qual_flags
+    pass
+
+
+def with_quality_behavior(obj):
+    """
+    Attach the flag properties to a collection carrying 'qual_flags'. Electron, LowPtElectron, Muon and
+    PtEtaPhiMCandidate keep their name (and coffea methods), other collections are renamed TaggedLepton.
+    """
+    name = obj.layout.purelist_parameter("__record__")
+
+    return ak.with_name(obj, name if name in TAGGED_CLASSES else "TaggedLepton", behavior={**(obj.behavior or {}), **behavior})
+
+
+def concatenate_leptons(collections):
+    """
+    ak.concatenate(collections, axis=1) of tagged lepton collections (e.g. electrons and muons) as PtEtaPhiMCandidate,
+    with the flag properties when they are packed: a plain concatenation of different collections is a union
+    whose records have no methods left
+    """
+    leptons = ak.with_name(ak.concatenate(collections, axis=1), "PtEtaPhiMCandidate")
+
+    if "qual_flags" in leptons.fields:
+        return with_quality_behavior(leptons)
+    return leptons
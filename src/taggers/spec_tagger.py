@@ -0,0 +1,303 @@
+# Compiles the lepton selections in lep_specs.py and evaluates them on flat columns
+#
+# Every expression of a spec is evaluated over the flattened columns of the collection, with numexpr when it is
+# installed (fused, no temporaries per cut) and plain numpy otherwise. The jagged structure is only rebuilt
+# once for the final quality fields. With jit=True the whole selection runs as one numba loop instead (jit_tagger.py).
+
+import ast
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from .flat_kernels import map_flat
+from .jit_tagger import jit_quality_kernel, numba
+from .lep_specs import LEP_SPECS
+from .quality import attach_quality, quality_kernel, _qual_tag_kernel
+from .vid_unpacked import VID_LEVELS, VID_ALIASES, _vid_comparator
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+COLLECTION_IDS = {
+    'ele': 'ele', 'electron': 'ele',
+    'lpte': 'lpte', 'lowptelectron': 'lpte',
+    'mu': 'muon', 'muon': 'muon',
+}
+
+_FUNCTIONS = {"abs": np.abs, "sqrt": np.sqrt}
+
+
+class CompiledSpec:
+
+    """
+    One collection of one era, ready to evaluate:
+    columns (what the kernel reads, cached columns included), branches (what is read from the file), vid working points,
+    named cut params, the cached columns (name, expression, code, inputs) and the (name, expression, code) steps in evaluation order
+    """
+
+    def __init__(self, spec):
+
+        self.vid = {
+            name: (VID_LEVELS[level], frozenset(VID_ALIASES.get(cut, cut) for cut in excluded))
+            for name, (level, excluded) in spec.get("vid", {}).items()
+        }
+        self.sip3d = spec["sip3d"]
+        self.sip3d_squared = spec.get("sip3d_squared", False)
+        self.params = dict(spec.get("params", {}))
+        self.constants = {}
+
+        steps = list(spec.get("derived", {}).items())
+        steps += [("baseline", spec["baseline"]), ("gold_silver", spec["gold_silver"])]
+
+        self.cached = []
+        for target, expression in spec.get("cached", {}).items():
+            expression, used = self._rewrite(expression)
+            inputs = sorted(used - set(_FUNCTIONS) - set(self.constants))
+            self.cached.append((target, expression, compile(expression, target, "eval"), inputs))
+
+        self.steps = []
+        names = set()
+        for target, expression in steps:
+            expression, used = self._rewrite(expression)
+            self.steps.append((target, expression, compile(expression, target, "eval")))
+            names |= used
+
+        defined = {target for target, _, _ in self.steps} | set(self.vid) | set(_FUNCTIONS) | set(self.constants) | set(self.params)
+        self.columns = sorted((names | {self.sip3d}) - defined)
+
+        # what has to be read from the file: the cached columns come from their inputs
+        cached = {target for target, _, _, _ in self.cached}
+        self.branches = sorted((set(self.columns) - cached).union(*(inputs for _, _, _, inputs in self.cached)))
+
+        if self.vid:
+            self.columns.append("vidNestedWPBitmap")
+            self.branches.append("vidNestedWPBitmap")
+
+    def _rewrite(self, expression):
+        tree = ast.parse(" ".join(expression.split()), mode="eval")
+        used = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+        tree = ast.fix_missing_locations(_NameFloatConstants(self.constants).visit(tree))
+
+        return ast.unparse(tree), used
+
+
+class _NameFloatConstants(ast.NodeTransformer):
+
+    # float literals become named constants, so they get the dtype of the columns (float32 for NanoAOD)
+    # like in numpy, instead of the float64 comparisons numexpr would do
+
+    def __init__(self, constants):
+        self.constants = constants
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, float):
+            return node
+
+        name = f"_const{len(self.constants)}"
+        self.constants[name] = node.value
+        return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+
+
+@lru_cache(maxsize=None)
+def compile_spec(era, collection):
+
+    if era not in LEP_SPECS:
+        sys.exit(f'era {era} not acceptable, must be in {list(LEP_SPECS)}')
+
+    collection = COLLECTION_IDS.get(collection.lower())
+    if collection not in LEP_SPECS[era]:
+        sys.exit(f'no {collection} spec for era {era}, have {list(LEP_SPECS[era])}')
+
+    return CompiledSpec(LEP_SPECS[era][collection])
+
+
+def spec_columns(era, collection):
+    """
+    Branches the era's selection reads for this collection
+    """
+    return list(compile_spec(era, collection).branches)
+
+
+def add_cached_columns(obj, era, collection):
+    """
+    Store the "cached" columns of the spec (e.g. the squared SIP3D 'sip3d2' of LowPtElectrons) on the collection
+    as fields, unless they are there already. Reassign the collection to keep them between calls
+    """
+    spec = compile_spec(era, collection)
+
+    for target, _, _, inputs in spec.cached:
+        if target not in obj.fields:
+            obj[target] = map_flat(
+                _cached_kernel, *(obj[column] for column in inputs),
+                era=era, collection=collection, target=target,
+            )
+
+    return obj
+
+
+def tag_quality_from_spec(obj, era, collection, sip3d_cut=3, packed=False, jit=False, params=None):
+    """
+    Add the quality fields ('isBaseline', 'isGold', 'isSilver', 'isBronze', 'qual_tag', or packed 'qual_flags')
+    to a lepton collection using the LEP_SPECS[era][collection] selection.
+    jit=True uses the numba loop when numba is installed (same bits), the numpy/numexpr path otherwise.
+    params overrides the spec "params", e.g. {"iso_cut": 3}
+    """
+    obj = add_cached_columns(obj, era, collection)
+    quality = quality_from_spec(obj, era, collection, sip3d_cut, packed, jit, params)
+
+    return attach_quality(obj, quality, packed)
+
+
+def quality_from_spec(obj, era, collection, sip3d_cut=3, packed=False, jit=False, params=None):
+    """
+    The quality fields of tag_quality_from_spec as a separate record array, without adding them to the collection
+    """
+    spec = compile_spec(era, collection)
+    obj = add_cached_columns(obj, era, collection)
+
+    return map_flat(
+        _spec_kernel, *(obj[column] for column in spec.columns),
+        era=era, collection=collection, sip3d_cut=sip3d_cut, packed=packed, jit=jit and numba is not None,
+        params=_params(spec, params),
+    )
+
+
+def scan_quality_from_spec(obj, era, collection, sip3d_cuts, iso_cuts=None):
+    """
+    Threshold scan: the qual_tag of every object for every (iso_cut, sip3d cut) pair of the two grids,
+    from a single read of the columns. Returns a var * len(iso_cuts) * len(sip3d_cuts) record array with
+    fields 'qual_tag', 'iso_cut', 'sip3d_cut'. iso_cuts defaults to the spec value.
+    """
+    spec = compile_spec(era, collection)
+
+    if iso_cuts is None:
+        iso_cuts = [_params(spec)["iso_cut"]]
+
+    obj = add_cached_columns(obj, era, collection)
+
+    return map_flat(
+        _scan_kernel, *(obj[column] for column in spec.columns),
+        era=era, collection=collection, sip3d_cuts=tuple(sip3d_cuts), iso_cuts=tuple(iso_cuts),
+    )
+
+
+def _params(spec, params=None):
+
+    unknown = set(params or {}) - set(spec.params)
+    if unknown:
+        sys.exit(f'unknown params {sorted(unknown)}, spec has {list(spec.params)}')
+
+    return {**spec.params, **(params or {})}
+
+
+def _spec_kernel(*flat_columns, era, collection, sip3d_cut, packed, jit=False, params=None):
+
+    spec = compile_spec(era, collection)
+    params = _params(spec, params)
+
+    float_dtype = _float_dtype(flat_columns)
+    sip3d_cut = _sip3d_threshold(spec, sip3d_cut)
+    if jit:
+        return jit_quality_kernel(spec, flat_columns, float_dtype, sip3d_cut, packed, params)
+
+    baseline, gold_silver, sip3d = _select(spec, _environment(spec, flat_columns, float_dtype), params, float_dtype)
+    sip3d_cut = sip3d.dtype.type(sip3d_cut) # compare like numpy does with a python number
+
+    gold = gold_silver & (sip3d < sip3d_cut)
+    silver = gold_silver & (sip3d >= sip3d_cut)
+    bronze = baseline & ~gold_silver
+
+    return quality_kernel(baseline, bronze, silver, gold, packed=packed)
+
+
+def _scan_kernel(*flat_columns, era, collection, sip3d_cuts, iso_cuts):
+
+    spec = compile_spec(era, collection)
+
+    float_dtype = _float_dtype(flat_columns)
+    env = _environment(spec, flat_columns, float_dtype) # columns bound once, only the selection is redone per iso cut
+
+    n = len(flat_columns[0])
+    qual_tag = np.empty((n, len(iso_cuts), len(sip3d_cuts)), dtype=np.int8)
+
+    for i, iso_cut in enumerate(iso_cuts):
+        baseline, gold_silver, sip3d = _select(spec, env, _params(spec, {"iso_cut": iso_cut}), float_dtype)
+
+        sip3d_grid = np.asarray([_sip3d_threshold(spec, cut) for cut in sip3d_cuts], dtype=sip3d.dtype)
+        gold = gold_silver[:, np.newaxis] & (sip3d[:, np.newaxis] < sip3d_grid)
+        silver = gold_silver[:, np.newaxis] & (sip3d[:, np.newaxis] >= sip3d_grid)
+        bronze = (baseline & ~gold_silver)[:, np.newaxis]
+
+        qual_tag[:, i, :] = _qual_tag_kernel(baseline[:, np.newaxis], bronze, silver, gold)
+
+    # the grid values themselves (float64, exactly what was asked for) so they can go on a histogram axis
+    shape = qual_tag.shape
+    return {
+        "qual_tag":  qual_tag,
+        "iso_cut":   np.ascontiguousarray(np.broadcast_to(np.asarray(iso_cuts, dtype=np.float64)[:, np.newaxis], shape)),
+        "sip3d_cut": np.ascontiguousarray(np.broadcast_to(np.asarray(sip3d_cuts, dtype=np.float64), shape)),
+    }
+
+
+def _cached_kernel(*flat_columns, era, collection, target):
+
+    spec = compile_spec(era, collection)
+    _, expression, code, inputs = next(cached for cached in spec.cached if cached[0] == target)
+
+    env = _environment(spec, flat_columns, _float_dtype(flat_columns), inputs)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = _evaluate(expression, code, env)
+
+    # x/0 gives inf and 0/0 nan: both mean there is no measured value, make them all inf (fails every upper cut)
+    return np.where(np.isnan(value), value.dtype.type(np.inf), value)
+
+
+def _sip3d_threshold(spec, sip3d_cut):
+    # squared SIP3D variables are compared to the squared cut, so no sqrt per object
+    return sip3d_cut * sip3d_cut if spec.sip3d_squared else sip3d_cut
+
+
+def _float_dtype(flat_columns):
+    return np.result_type(*[column.dtype for column in flat_columns if column.dtype.kind == "f"] or [np.float64])
+
+
+def _environment(spec, flat_columns, float_dtype, columns=None):
+
+    env = {}
+    for name, column in zip(columns or spec.columns, flat_columns):
+        if column.dtype.kind in "iu" and column.dtype.itemsize < 4:
+            column = column.astype(np.int32) # numexpr has no (u)int8/16
+        env[name] = column
+
+    for name, value in spec.constants.items():
+        env[name] = np.asarray(value, dtype=float_dtype)
+
+    if "vidNestedWPBitmap" in env:
+        bitmap = env.pop("vidNestedWPBitmap").astype(np.uint32)
+        for name, (level, excluded) in spec.vid.items():
+            env[name] = _vid_comparator(level, excluded)(bitmap)
+
+    return env
+
+
+def _select(spec, env, params, float_dtype):
+    # baseline, gold_silver (already baseline & ...) and the sip3d column
+
+    env = {**env, **{name: np.asarray(value, dtype=float_dtype) for name, value in params.items()}}
+    for target, expression, code in spec.steps:
+        env[target] = _evaluate(expression, code, env)
+
+    baseline = env["baseline"]
+
+    return baseline, baseline & env["gold_silver"], env[spec.sip3d]
+
+
+def _evaluate(expression, code, env):
+    if numexpr is not None:
+        return numexpr.evaluate(expression, local_dict=env)
+    return eval(code, {"__builtins__": {}, **_FUNCTIONS}, env)
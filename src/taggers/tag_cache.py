@@ -0,0 +1,155 @@
+# On-disk cache of the tagger output, one npz sidecar per tagger and chunk
+#
+# make_pikl reruns the same files many times a day. In the processor
+#
+#   ele = tag_cached(tagger.tag_ele, events.Electron, events.metadata)
+#
+# loads the quality flags from the sidecar of this (file uuid, entry range, is_mc, tagger version) when it exists
+# and only runs the tagger otherwise. gen_tag stays lazy (gen_tagger.tag_gen): it has its own sidecar, read or
+# filled only when gen_tag is read. The tagger version is a hash of the tagger sources, the era specs, the switch
+# values of the tagger module (ERA, global_sip3d, ...) and the gen_filter parents and thresholds, so changing a cut
+# never reuses old sidecars. The directory is kept under MAX_CACHE_BYTES by deleting the least recently used sidecars.
+
+import copy
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+
+from . import gen_filter
+from .flat_kernels import flat_numpy, is_dask, lazy_like, unflatten_like
+from .lep_specs import LEP_SPECS
+from .quality import attach_quality, quality_kernel, unpack_quality_kernel
+
+
+CACHE_DIR = os.environ.get("ANALYSIS_TOOLS_TAG_CACHE", os.path.expanduser("~/.cache/analysis_tools/tags"))
+MAX_CACHE_BYTES = 5 * 1024**3
+
+# gen_filter settings the gen_tag depends on, editable at runtime
+GEN_FILTER_CONFIG = ["WZ_PARENTS", "SUSY_PARENTS", "PARENT_PDGIDS", "GEN_PT_MIN", "GEN_ABS_ETA_MAX"]
+
+
+def tag_cached(tagger, obj, metadata, packed=False, cache_dir=None, max_bytes=None):
+    """
+    tagger(obj, packed) (tag_ele, tag_lpte or tag_muon of lep_tagger / lep_tagger_UL), with the resulting
+    'gen_tag' and quality fields cached on disk. metadata is events.metadata of a coffea processor chunk;
+    without a file uuid and entry range (or on dask collections) this just calls the tagger.
+    """
+    if is_dask(obj) or not all(metadata.get(key) not in (None, "") for key in ("fileuuid", "entrystart", "entrystop")):
+        return tagger(obj, packed)
+
+    cache_dir = Path(cache_dir or CACHE_DIR)
+    key = sidecar_key(tagger, metadata)
+    path, gen_path = cache_dir / f"{key}.npz", cache_dir / f"{key}.gen_tag.npz"
+
+    counts = ak.to_numpy(ak.num(obj, axis=1))
+    columns = _load(path, counts, "qual_flags")
+
+    if columns is None:
+        obj = tagger(obj, packed)
+        _store(path, counts, qual_flags=flat_numpy(obj.qual_flags) if packed else _flags(obj))
+        evict(cache_dir, MAX_CACHE_BYTES if max_bytes is None else max_bytes)
+        gen_tag = obj.gen_tag # still lazy
+        tag_gen = lambda: flat_numpy(gen_tag)
+    else:
+        flags = columns["qual_flags"]
+        quality = {"qual_flags": flags} if packed else unpack_quality_kernel(flags)
+        source = copy.copy(obj) # untouched by attach_quality, for tagging gen_tag on a copy if it has to be computed
+        obj = attach_quality(obj, unflatten_like(ak.zip(quality), obj), packed)
+        tag_gen = lambda: flat_numpy(tagger(copy.copy(source), packed).gen_tag)
+
+    obj["gen_tag"] = lazy_like(obj, np.int8, lambda n: _cached_gen_tag(gen_path, counts, tag_gen))
+
+    return obj
+
+
+def sidecar_key(tagger, metadata):
+    """
+    Name of the sidecars of one tagger on one chunk: hash of file uuid, entry range, is_mc and tagger version
+    """
+    is_mc = bool(metadata.get("is_mc", True)) # like gen_tagger.sample_is_mc
+    key = f"{metadata['fileuuid']}:{metadata['entrystart']}:{metadata['entrystop']}:{is_mc}:{tagger_version(tagger)}"
+
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def tagger_version(tagger):
+    """
+    Hash of everything the tagger output depends on: the sources of this package, the era specs,
+    the plain-value globals of the tagger module (ERA, global_sip3d, ...) and the GEN_FILTER_CONFIG of gen_filter
+    """
+    module = sys.modules[tagger.__module__]
+    config = {
+        name: value for name, value in vars(module).items()
+        if not name.startswith("_") and isinstance(value, (bool, int, float, str))
+    }
+    gen_config = {name: getattr(gen_filter, name) for name in GEN_FILTER_CONFIG}
+
+    digest = hashlib.sha1(f"{tagger.__module__}.{tagger.__name__}:{sorted(config.items())}:{gen_config}:{LEP_SPECS}".encode())
+    for source in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(source.read_bytes())
+
+    return digest.hexdigest()
+
+
+def evict(cache_dir, max_bytes=MAX_CACHE_BYTES):
+    """
+    Delete the least recently used sidecars (by mtime, refreshed on every hit) until the directory fits in max_bytes
+    """
+    sidecars = []
+    for path in Path(cache_dir).glob("*.npz"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError: # removed by another worker
+            continue
+        sidecars.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in sidecars)
+    for _, size, path in sorted(sidecars):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def _flags(obj):
+    # flat packed qual_flags of an unpacked collection
+    return quality_kernel(*(flat_numpy(obj[name]) for name in ("isBaseline", "isBronze", "isSilver", "isGold")), packed=True)["qual_flags"]
+
+
+def _cached_gen_tag(path, counts, tag_gen):
+    # flat gen_tag from its sidecar, or from tag_gen() and stored: only runs when gen_tag is read
+    columns = _load(path, counts, "gen_tag")
+    if columns is not None:
+        return columns["gen_tag"]
+
+    gen_tag = tag_gen()
+    _store(path, counts, gen_tag=gen_tag)
+    return gen_tag
+
+
+def _load(path, counts, *names):
+    try:
+        with np.load(path) as sidecar:
+            columns = {name: sidecar[name] for name in ("counts",) + names}
+        os.utime(path) # most recently used
+    except (OSError, ValueError, KeyError):
+        return None
+
+    if not np.array_equal(columns["counts"], counts): # not the same objects, e.g. collection was cut before tagging
+        return None
+
+    return columns
+
+
+def _store(path, counts, **columns):
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write then rename, so workers never see half-written sidecars
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as out:
+        np.savez(out, counts=counts.astype(np.uint32), **columns)
+    os.replace(tmp, path)
@@ -2,31 +2,73 @@
 # https://twiki.cern.ch/twiki/bin/viewauth/CMS/CutBasedElectronIdentificationRun3
 # This can only be used on electrons, the variable does not exist for other objects
 
-import awkward as ak
+import sys
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from .flat_kernels import is_dask, map_flat
+
+
+# order matters: cut i lives in bits 3*i .. 3*i+2 of vidNestedWPBitmap
+VID_CUTS = [
+    "MinPtCut",
+    "GsfEleSCEtaMultiRangeCut",
+    "GsfEleDEtaInSeedCut",
+    "GsfEleDPhiInCut",
+    "GsfEleFull5x5SigmaIEtaIEtaCut",
+    "GsfEleHadronicOverEMEnergyScaledCut",
+    "GsfEleEInverseMinusPInverseCut",
+    "GsfEleRelPFIsoScaledCut",
+    "GsfEleConversionVetoCut",
+    "GsfEleMissingHitsCut",
+]
+
+VID_SHIFTS = np.arange(0, 3 * len(VID_CUTS), 3, dtype=np.uint32)
+
+
+_LEVELS = weakref.WeakKeyDictionary() # Electron layout -> decoded cut levels, so a collection decodes its bitmap once
+_DASK_LEVELS = OrderedDict()          # same for dask, by bitmap name, LRU
+DASK_LEVELS_SIZE = 16                 # dask graphs kept in _DASK_LEVELS
+
+
+def vid_levels(ele_obj):
+    """
+    Cut levels of every electron as one var * 10 * uint8 array (columns follow VID_CUTS), decoded in one pass.
+    Cached next to the collection (not on it), later calls on the same collection reuse the decoding.
+    """
+    if is_dask(ele_obj):
+        cache, key = _DASK_LEVELS, ele_obj.vidNestedWPBitmap.name
+    else:
+        cache, key = _LEVELS, ele_obj.layout
+
+    if key not in cache:
+        cache[key] = map_flat(_decode_kernel, ele_obj.vidNestedWPBitmap)
+
+    if cache is _DASK_LEVELS:
+        cache.move_to_end(key)
+        while len(cache) > DASK_LEVELS_SIZE:
+            cache.popitem(last=False)
+
+    return cache[key]
+
+
+def _decode_kernel(bitmap):
+    return ((bitmap.astype(np.uint32)[:, None] >> VID_SHIFTS) & 0b111).astype(np.uint8)
+
 
 def vidUnpackedWP(ele_obj):
     """
     Return a dictionary of the cuts in the electron cutBasedID,
     e.g. results["GsfEleEInverseMinusPInverseCut"] will be 0 (fail), 1, 2, 3, or 4 (tight)
     """
+    levels = vid_levels(ele_obj)
+
     results = {}
-    for name, shift in zip(
-        [
-            "MinPtCut",
-            "GsfEleSCEtaMultiRangeCut",
-            "GsfEleDEtaInSeedCut",
-            "GsfEleDPhiInCut",
-            "GsfEleFull5x5SigmaIEtaIEtaCut",
-            "GsfEleHadronicOverEMEnergyScaledCut",
-            "GsfEleEInverseMinusPInverseCut",
-            "GsfEleRelPFIsoScaledCut",
-            "GsfEleConversionVetoCut",
-            "GsfEleMissingHitsCut",
-        ],
-        range(0, 28, 3),
-        #range(0, 11, 1),
-    ):
-        results[name] = (ele_obj.vidNestedWPBitmap >> shift) & 0b111
+    for i, name in enumerate(VID_CUTS):
+        results[name] = levels[:, :, i]
     return results
 
 
@@ -38,240 +80,156 @@ def vidUnpackedWPSelection(electrons, level):
     results = {}
     for name, cut_level in vidUnpackedWP(electrons).items():
         results[name] = cut_level >= level
-        
+
     return results
 
 
-# VETO ID without Isolation and without H/E cut:
+ISO_CUT = "GsfEleRelPFIsoScaledCut"
+HOE_CUT = "GsfEleHadronicOverEMEnergyScaledCut"
 
-def veto(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 1) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 1) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 1) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 1) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 1) &
-        (vid_Unpacked['GsfEleHadronicOverEMEnergyScaledCut'] >= 1) &
-        (vid_Unpacked['GsfEleRelPFIsoScaledCut'] >= 1) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 1) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 1) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 1)
-    )
+VID_LEVELS = {"fail": 0, "veto": 1, "loose": 2, "medium": 3, "tight": 4}
+VID_ALIASES = {"iso": ISO_CUT, "hoe": HOE_CUT}
+
+
+###########################################################################
+# Working points straight from the bitmap
+#
+# The 3 bit fields are split into even and odd cuts, so every field gets the 3 (zeroed) bits of its
+# neighbour as headroom. Adding (8 - level) to a field then carries into its bit 3 exactly when
+# field >= level, so one add, one AND and one compare test all cuts of a working point at once.
 
-    return mask
+_EVEN_FIELDS = sum(0b111 << shift for shift in VID_SHIFTS[0::2].tolist())
+_ODD_FIELDS  = sum(0b111 << shift for shift in VID_SHIFTS[1::2].tolist())
 
 
+@lru_cache(maxsize=None)
+def _vid_comparator(level, exclude):
+    """
+    Build (once per level/exclude pair) the function turning raw flat bitmaps into a pass mask
+    """
+    add_even = add_odd = check_even = check_odd = 0
+
+    for i, (name, shift) in enumerate(zip(VID_CUTS, VID_SHIFTS.tolist())):
+        if name in exclude:
+            continue
+        if i % 2 == 0:
+            add_even   |= (8 - level) << shift
+            check_even |= 0b1000 << shift
+        else:
+            add_odd    |= (8 - level) << shift
+            check_odd  |= 0b1000 << shift
+
+    even_mask, odd_mask = np.uint32(_EVEN_FIELDS), np.uint32(_ODD_FIELDS)
+    add_even, add_odd = np.uint32(add_even), np.uint32(add_odd)
+    check_even, check_odd = np.uint32(check_even), np.uint32(check_odd)
+    check = check_even | check_odd
+
+    def comparator(bitmap):
+        carries = (
+            (((bitmap & even_mask) + add_even) & check_even)
+            | (((bitmap & odd_mask) + add_odd) & check_odd)
+        )
+        return carries == check
+
+    return comparator
+
+
+def vid_pass(electrons, level, exclude=()):
+    """
+    Boolean mask of electrons passing every cutBasedID cut at >= level, skipping the cuts in exclude.
+
+    level can be an int (1 veto ... 4 tight) or a name from VID_LEVELS,
+    exclude takes cut names from VID_CUTS or the short aliases 'iso' and 'hoe',
+    e.g. vid_pass(ele, 'loose', exclude=('iso', 'hoe')) is the old loose_minus_iso_hoe(ele)
+    """
+    if isinstance(level, str):
+        if level.lower() not in VID_LEVELS:
+            sys.exit(f'level {level} not acceptable, must be in {list(VID_LEVELS)}')
+        level = VID_LEVELS[level.lower()]
+
+    excluded = frozenset(VID_ALIASES.get(name, name) for name in exclude)
+    if not excluded <= set(VID_CUTS):
+        sys.exit(f'cannot exclude {sorted(excluded - set(VID_CUTS))}, must be in {VID_CUTS} or {list(VID_ALIASES)}')
 
+    return map_flat(_vid_pass_kernel, electrons.vidNestedWPBitmap, level=level, excluded=excluded)
 
 
+def _vid_pass_kernel(bitmap, level, excluded):
+    return _vid_comparator(level, excluded)(bitmap.astype(np.uint32))
+
+
+# levels only go up to 4, so tight (== 4) is the same as >= 4
+
+
+# VETO ID without Isolation and without H/E cut:
+
+def veto(ele_obj):
+    return vid_pass(ele_obj, "veto")
+
 def veto_minus_iso(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 1) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 1) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 1) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 1) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 1) &
-        (vid_Unpacked['GsfEleHadronicOverEMEnergyScaledCut'] >= 1) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 1) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 1) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 1)
-    )
-
-    return mask
+    return vid_pass(ele_obj, "veto", exclude=("iso",))
 
 def veto_minus_hoe(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 1) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 1) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 1) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 1) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 1) &
-        (vid_Unpacked['GsfEleRelPFIsoScaledCut'] >= 1) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 1) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 1) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 1)
-    )
-
-    return mask
-
+    return vid_pass(ele_obj, "veto", exclude=("hoe",))
 
 def veto_minus_iso_hoe(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj) 
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 1) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 1) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 1) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 1) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 1) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 1) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 1) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 1)
-    )
-
-    return mask
+    return vid_pass(ele_obj, "veto", exclude=("iso", "hoe"))
 
 def loose_minus_iso(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 2) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 2) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 2) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 2) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 2) &
-        (vid_Unpacked['GsfEleHadronicOverEMEnergyScaledCut'] >= 2) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 2) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 2) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 2)
-    )
-
-    return mask
+    return vid_pass(ele_obj, "loose", exclude=("iso",))
 
 def loose_minus_hoe(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 2) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 2) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 2) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 2) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 2) &
-        (vid_Unpacked['GsfEleRelPFIsoScaledCut'] >= 2) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 2) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 2) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 2)
-    )
-
-    return mask
-
+    return vid_pass(ele_obj, "loose", exclude=("hoe",))
 
 def loose_minus_iso_hoe(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj) 
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 2) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 2) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 2) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 2) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 2) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 2) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 2) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 2)
-    )
-
-    return mask
+    return vid_pass(ele_obj, "loose", exclude=("iso", "hoe"))
 
 def medium_minus_iso_hoe(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj) 
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 3) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 3) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 3) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 3) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 3) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 3) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 3) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 3)
-    )
-
-    return mask
+    return vid_pass(ele_obj, "medium", exclude=("iso", "hoe"))
 
 
 # TIGHT ID without Isolation and without H/E cut:
 
 def tight_minus_iso(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] == 4) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] == 4) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] == 4) &
-        (vid_Unpacked['GsfEleDPhiInCut'] == 4) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] == 4) &
-        (vid_Unpacked['GsfEleHadronicOverEMEnergyScaledCut'] == 4) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] == 4) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] == 4) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] == 4)
-    )
-
-    return mask
+    return vid_pass(ele_obj, "tight", exclude=("iso",))
 
 def tight_minus_hoe(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] >= 4) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] >= 4) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] >= 4) &
-        (vid_Unpacked['GsfEleDPhiInCut'] >= 4) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] >= 4) &
-        (vid_Unpacked['GsfEleRelPFIsoScaledCut'] >= 4) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] >= 4) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] >= 4) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] >= 4)
-    )
-
-    return mask
-
+    return vid_pass(ele_obj, "tight", exclude=("hoe",))
 
 def tight_minus_iso_hoe(ele_obj):
-    
-    vid_Unpacked = vidUnpackedWP(ele_obj)
-    
-    #print(vidUnpacked.keys()) #testing before deleting the iso and hoe cut
-    
-    mask = (
-        (vid_Unpacked['MinPtCut'] == 4) & 
-        (vid_Unpacked['GsfEleSCEtaMultiRangeCut'] == 4) &
-        (vid_Unpacked['GsfEleDEtaInSeedCut'] == 4) &
-        (vid_Unpacked['GsfEleDPhiInCut'] == 4) &
-        (vid_Unpacked['GsfEleFull5x5SigmaIEtaIEtaCut'] == 4) &
-        (vid_Unpacked['GsfEleEInverseMinusPInverseCut'] == 4) &
-        (vid_Unpacked['GsfEleConversionVetoCut'] == 4) &
-        (vid_Unpacked['GsfEleMissingHitsCut'] == 4)
-    )
+    return vid_pass(ele_obj, "tight", exclude=("iso", "hoe"))
+
 
-    return mask
+###########################################################################
+# Cutflow / N-1 patterns
 
+# bits of the pass pattern for one (level, cut) pair
+PASS_CUT      = 0b001 # passes this cut
+PASS_OTHERS   = 0b010 # passes every other cut (N-1 denominator)
+PASS_PREVIOUS = 0b100 # passes every cut before this one in VID_CUTS order (cumulative cutflow)
+
+
+def vid_cutflow_patterns(ele_obj):
+    """
+    Pass pattern (PASS_* bits) of every cut at every level, one var * 4 * 10 uint8 array
+    indexed like patterns[event, level - 1, cut index], from a single decode of the bitmap.
+
+    N-1 efficiency of a cut: pattern has PASS_CUT | PASS_OTHERS, out of pattern has PASS_OTHERS
+    cumulative count through a cut: pattern has PASS_CUT | PASS_PREVIOUS
+    """
+    return map_flat(_cutflow_kernel, ele_obj.vidNestedWPBitmap)
 
 
+def _cutflow_kernel(bitmap):
+    levels = _decode_kernel(bitmap)
+    thresholds = np.arange(1, 5, dtype=np.uint8)[None, :, None]
 
+    failed = levels[:, None, :] < thresholds # (n, 4 levels, 10 cuts)
+    n_failed = failed.sum(axis=2, keepdims=True)
+    n_failed_before = np.cumsum(failed, axis=2) - failed
 
+    return (
+        (~failed) * PASS_CUT
+        + ((n_failed - failed) == 0) * PASS_OTHERS
+        + (n_failed_before == 0) * PASS_PREVIOUS
+    ).astype(np.uint8)